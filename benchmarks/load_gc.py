@@ -0,0 +1,81 @@
+# Measures the time to load a journal and the pauses of the cyclic garbage
+# collector during loading, with the collector paused as the loader does
+# and with it left running.
+#
+#   python benchmarks/load_gc.py [TRANSACTIONS | FILE]
+
+import gc
+import io
+import os
+import sys
+import time
+
+from contextlib import nullcontext
+
+from ledgerbeans import loader
+
+
+transaction = '''\
+2024/{month:02d}/{day:02d} * Payee {i}  ; :tag{tag}:
+    Expenses:Account{account}   {amount} EUR
+    Assets:Bank
+
+'''
+
+
+def journal_text(count):
+    return ''.join(transaction.format(month=i % 12 + 1, day=i % 28 + 1,
+                                      i=i, tag=i % 50, account=i % 200,
+                                      amount=i % 997 + 0.5)
+                   for i in range(count))
+
+
+class PauseTimer:
+    # Times every collection through gc.callbacks.
+    def __init__(self):
+        self.pauses = []
+        self.start = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self.start = time.perf_counter()
+        elif self.start is not None:
+            self.pauses.append(time.perf_counter() - self.start)
+            self.start = None
+
+
+def run(name, text, collect):
+    f = io.StringIO(text)
+    f.name = '<benchmark>'
+    timer = PauseTimer()
+    disabled = loader.gc_disabled
+    if collect:
+        loader.gc_disabled = nullcontext
+    gc.collect()
+    gc.callbacks.append(timer)
+    try:
+        start = time.perf_counter()
+        journal = loader.load(f)
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.callbacks.remove(timer)
+        loader.gc_disabled = disabled
+    assert len(journal.children)
+    print('{:12} {:6.2f}s {:6d} collections {:6.2f}s total pause '
+          '{:6.3f}s longest'.format(name, elapsed, len(timer.pauses),
+                                    sum(timer.pauses),
+                                    max(timer.pauses, default=0)))
+
+
+def main(argv):
+    if argv and os.path.isfile(argv[0]):
+        with open(argv[0]) as f:
+            text = f.read()
+    else:
+        text = journal_text(int(argv[0]) if argv else 60000)
+    run('gc running', text, True)
+    run('gc paused', text, False)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,61 @@
+# Measures parsing throughput for many small documents from several
+# threads, with pooled parsers and with a parser built per document.
+#
+#   python benchmarks/parse_small.py [DOCUMENTS] [THREADS]
+
+import io
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ply.yacc import NullLogger
+
+from ledgerbeans.api import parse_string
+from ledgerbeans.lexer import LedgerLexer
+from ledgerbeans.parser import LedgerParser, ParserPool
+
+
+document = '''\
+2024/01/{day:02d} * (42) Grocer  ; :food:
+    Expenses:Food   {amount} EUR
+    Assets:Bank
+
+2024/01/{day:02d} Salary
+    Assets:Bank   1000.00 EUR
+    Income:Salary
+'''
+
+
+def documents(count):
+    return [document.format(day=i % 28 + 1, amount=i % 997 + 0.5)
+            for i in range(count)]
+
+
+def parse_unpooled(text):
+    f = io.StringIO(text)
+    f.name = '<string>'
+    parser = LedgerParser(errorlog=NullLogger())
+    return parser.parse(LedgerLexer(f))
+
+
+def run(name, func, texts, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        journals = list(executor.map(func, texts))
+    elapsed = time.perf_counter() - start
+    assert all(len(list(j.transactions())) == 2 for j in journals)
+    print('{:10} {:8.0f} documents/s'.format(name, len(texts) / elapsed))
+
+
+def main(argv):
+    count = int(argv[0]) if argv else 5000
+    threads = int(argv[1]) if len(argv) > 1 else 4
+    texts = documents(count)
+    pool = ParserPool(size=threads)
+    run('unpooled', parse_unpooled, texts, threads)
+    run('pooled', lambda text: parse_string(text, pool=pool), texts, threads)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
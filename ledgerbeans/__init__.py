@@ -1,4 +1,8 @@
-import pkg_resources
-
-
-version = pkg_resources.get_distribution(__name__).version
+def __getattr__(name):
+    # Importing pkg_resources is slow, so the version is only looked up
+    # when it is used.
+    if name == 'version':
+        import pkg_resources
+        return pkg_resources.get_distribution(__name__).version
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__,
+                                                                    name))
@@ -0,0 +1,24 @@
+import io
+
+from ledgerbeans.loader import LoadError, check_balances, load
+from ledgerbeans.parser import ParserPool
+
+
+__all__ = ['LoadError', 'ParserPool', 'parse_file', 'parse_string']
+
+
+def parse_string(text, name='<string>', pool=None):
+    # Parses a ledger document held in memory, raising LoadError when it is
+    # invalid. Safe to call from several threads at once.
+    f = io.StringIO(text)
+    f.name = name
+    journal = load(f, pool=pool)
+    check_balances([journal])
+    return journal
+
+
+def parse_file(filename, pool=None):
+    with open(filename) as f:
+        journal = load(f, pool=pool)
+    check_balances([journal])
+    return journal
@@ -0,0 +1,188 @@
+from ledgerbeans import ast
+from ledgerbeans.balancing import UnbalancedError, balance_transaction
+from ledgerbeans.report import format_amount, posting_amounts, symbol_of
+
+
+class BalanceError(Exception):
+    def __init__(self, filename, lineno, message):
+        super().__init__(filename, lineno, message)
+        self.filename = filename
+        self.lineno = lineno
+        self.message = message
+
+
+def fingerprint(xact):
+    # Identifies a transaction by everything that affects balances, so an
+    # unchanged transaction is recognized after the file is parsed again.
+    posts = []
+    for post in xact:
+        if isinstance(post, ast.Posting):
+            amount = post.amount if not post.assigned else None
+            posts.append((post.account.name, post.account.flags['virtual'],
+                          post.account.flags['balanced'],
+                          amount.amount if amount is not None else None,
+                          amount.symbol if amount is not None else None,
+                          post.balance.amount
+                          if post.balance is not None else None,
+                          post.balance.symbol
+                          if post.balance is not None else None))
+    return (xact.ordinal, tuple(posts))
+
+
+class BalanceChecker:
+    # Keeps running per-account, per-commodity balances over transactions
+    # in date order, so every balance assertion is checked against a
+    # dictionary lookup instead of a sum over the history of its account.
+    #
+    # Checking again after the journal changed replays the balances from
+    # the last checkpoint before the first changed transaction, and only
+    # verifies the assertions from that transaction on. Amounts assigned
+    # by balance assignments before it are copied from the previous check.
+    checkpoint_interval = 1024
+
+    def __init__(self, openings=None):
+        # Opening balances as {account: Totals}, see shard.load_manifest().
+        self.openings = {}
+        for name, totals in (openings or {}).items():
+            self.openings[name] = dict(totals.quantities)
+        self.fingerprints = []
+        self.assignments = []
+        self.checkpoints = {}
+
+    def copy_balances(self, balances):
+        return {name: dict(commodities)
+                for name, commodities in balances.items()}
+
+    def check(self, transactions):
+        # Returns the number of assertions verified, raising BalanceError
+        # for the first one that fails.
+        transactions = list(transactions)
+        fingerprints = [fingerprint(xact) for xact in transactions]
+        first = 0
+        for old, new in zip(self.fingerprints, fingerprints):
+            if old != new:
+                break
+            first += 1
+        start = first - first % self.checkpoint_interval
+        while start and start not in self.checkpoints:
+            start -= self.checkpoint_interval
+        if start:
+            balances = self.copy_balances(self.checkpoints[start])
+        else:
+            balances = self.copy_balances(self.openings)
+        for i in range(first):
+            self.reassign(transactions[i], self.assignments[i])
+        self.fingerprints = fingerprints
+        del self.assignments[first:]
+        for i in list(self.checkpoints):
+            if i > first:
+                del self.checkpoints[i]
+        verified = 0
+        for i in range(start, len(transactions)):
+            xact = transactions[i]
+            if i % self.checkpoint_interval == 0:
+                self.checkpoints[i] = self.copy_balances(balances)
+            if i < first:
+                self.post(xact, balances)
+                continue
+            try:
+                self.assignments.append(self.assign(xact, balances))
+                verified += self.post(xact, balances, verify=True)
+            except BalanceError:
+                # Check this transaction again next time.
+                del self.assignments[i:]
+                del self.fingerprints[i:]
+                raise
+        return verified
+
+    def reassign(self, xact, assignments):
+        # The assignments are kept by the index of their posting, as xact
+        # is parsed anew and holds other posting objects than the last time.
+        for i, amount in assignments:
+            post = xact.children[i]
+            post.amount = amount
+            post.assigned = True
+        if assignments:
+            balance_transaction(xact)
+
+    def assign(self, xact, balances):
+        # Gives postings with a balance but no amount the amount that
+        # brings their account to that balance.
+        assignments = []
+        pending = {}
+        for i, post in enumerate(xact.children):
+            if not isinstance(post, ast.Posting):
+                continue
+            name = post.account.name
+            if post.amount is not None and not post.assigned:
+                symbol = post.amount.symbol
+                key = (name, symbol_of(symbol))
+                pending[key] = pending.get(key, 0) + post.amount.amount
+            elif post.balance is not None:
+                symbol = post.balance.symbol
+                key = (name, symbol_of(symbol))
+                current = balances.get(name, {}).get(key[1], 0) + \
+                    pending.get(key, 0)
+                post.amount = ast.Amount(post.balance.amount - current,
+                                         symbol=symbol)
+                post.assigned = True
+                pending[key] = pending.get(key, 0) + post.amount.amount
+                assignments.append((i, post.amount))
+        if assignments:
+            # The groups of the assigned postings are balanced now that
+            # their amounts are known.
+            try:
+                balance_transaction(xact)
+            except UnbalancedError as e:
+                raise BalanceError(xact.source, e.lineno, e.message)
+        return assignments
+
+    def post(self, xact, balances, verify=False):
+        verified = 0
+        for post, quantity, commodity in posting_amounts(xact):
+            commodities = balances.setdefault(post.account.name, {})
+            symbol = symbol_of(commodity)
+            commodities[symbol] = commodities.get(symbol, 0) + quantity
+            if verify and post.balance is not None:
+                self.verify(xact, post, commodities)
+                verified += 1
+        return verified
+
+    def verify(self, xact, post, commodities):
+        expected = post.balance
+        symbol = symbol_of(expected.symbol)
+        if symbol is None and not expected.amount:
+            # A balance of zero without a commodity asserts that the
+            # account is empty in every commodity.
+            wrong = [s for s, q in commodities.items() if q]
+        elif commodities.get(symbol, 0) != expected.amount:
+            wrong = [symbol]
+        else:
+            wrong = []
+        if wrong:
+            actual = ', '.join(format_amount(commodities.get(s, 0),
+                                             self.style(xact, s))
+                               for s in wrong)
+            raise BalanceError(xact.source, post.lineno or xact.lineno,
+                               'Balance assertion failed: {} is {}, '
+                               'expected {}'.format(
+                                   post.account.name, actual,
+                                   format_amount(expected.amount,
+                                                 expected.symbol)))
+
+    def style(self, xact, symbol):
+        for post, quantity, commodity in posting_amounts(xact):
+            if symbol_of(commodity) == symbol:
+                return commodity
+        return (symbol, 'S') if symbol is not None else None
+
+
+def assign_balances(transactions):
+    # Gives balance assignments their amounts while the transactions pass
+    # by, keeping nothing but the running balances.
+    checker = BalanceChecker()
+    balances = {}
+    for xact in transactions:
+        checker.assign(xact, balances)
+        checker.post(xact, balances)
+        yield xact
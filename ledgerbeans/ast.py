@@ -1,12 +1,36 @@
-import datetime
+import weakref
 
 from decimal import Decimal
 
+from ledgerbeans.date import (create_date, from_ordinal, to_ordinal,
+                              PartialDate)
+
 
 class Node:
+    # Parents are referenced weakly, so a tree holds no reference cycles
+    # and is freed by reference counting alone.
     def __init__(self, parent=None, **kw):
+        super().__init__(**kw)
         self.parent = parent
 
+    @property
+    def parent(self):
+        if self._parent is None:
+            return None
+        return self._parent()
+
+    @parent.setter
+    def parent(self, parent):
+        if parent is None:
+            self._parent = None
+        else:
+            self._parent = weakref.ref(parent)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_parent'] = None
+        return state
+
 
 class CompositeNode(Node):
     def __init__(self, children=None, **kw):
@@ -34,11 +58,24 @@ class CompositeNode(Node):
         for child in self.children:
             child.parent = self
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reparent_children()
+
 
 class Journal(CompositeNode):
     def __init__(self, name='', **kw):
         super().__init__(**kw)
         self.name = name
+        self.tag_index = None
+        self.text_index = None
+        # The number of postings with a balance assertion or assignment.
+        self.assertions = 0
+
+    def transactions(self):
+        for item in self.children:
+            if isinstance(item, Transaction):
+                yield item
 
 
 class Status:
@@ -53,21 +90,69 @@ class Status:
 
 class Transaction(CompositeNode, Status):
     def __init__(self, date, description, auxdate=None, code=None,
-                 note=None, **kw):
+                 note=None, source=None, lineno=None, year=None, **kw):
         super().__init__(**kw)
-        self.date = create_date(date)
-        self.auxdate = create_date(auxdate)
+        self.source = source
+        self.lineno = lineno
+        self.ordinal = to_ordinal(date, year)
+        if auxdate is None:
+            self.auxordinal = None
+        else:
+            self.auxordinal = to_ordinal(auxdate, year)
         self.code = code
         self.description = description
         self.note = note
 
+    @property
+    def date(self):
+        return from_ordinal(self.ordinal)
+
+    @property
+    def auxdate(self):
+        if self.auxordinal is None:
+            return None
+        return from_ordinal(self.auxordinal)
+
+
+class AutomatedTransaction(CompositeNode):
+    def __init__(self, patterns, lineno=None, **kw):
+        super().__init__(**kw)
+        self.patterns = patterns
+        self.lineno = lineno
+
+
+class PeriodicTransaction(CompositeNode):
+    # A transaction that recurs on the dates of interval, a
+    # period.Interval parsed from text.
+    def __init__(self, text, interval, source=None, lineno=None, **kw):
+        super().__init__(**kw)
+        self.text = text
+        self.interval = interval
+        self.source = source
+        self.lineno = lineno
+
 
 class Posting(Node, Status):
-    def __init__(self, account, amount, note=None, **kw):
+    def __init__(self, account, amount, note=None, generated=False,
+                 balance=None, lineno=None, lot=None, price=None, **kw):
         super().__init__(**kw)
         self.account = account
         self.amount = amount
+        # The lot the amount was bought as or is sold from, and the price
+        # it was exchanged at.
+        self.lot = lot
+        self.price = price
         self.note = note
+        # Set on postings added by an automated transaction.
+        self.generated = generated
+        # The balance the account has after this posting. When the posting
+        # has no amount of its own, its amount is assigned from it.
+        self.balance = balance
+        self.assigned = False
+        # Set when the amount was left out and inferred from the other
+        # postings, see balancing.balance_transaction().
+        self.inferred = False
+        self.lineno = lineno
 
 
 class Account(Node):
@@ -95,62 +180,77 @@ def D(str_ord=None):
 
 
 class Amount(Node):
-    def __init__(self, amount, symbol=None, **kw):
+    def __init__(self, amount, symbol=None, expression=None, **kw):
         super().__init__(**kw)
         if amount is not None:
             self.amount = D(amount)
         else:
             self.amount = amount
         self.symbol = symbol
+        # The value expression the amount was computed from, if any.
+        self.expression = expression
 
 
-def create_date(date_tuple):
-    if date_tuple is None:
-        return None
-    year, month, day = date_tuple
-    if year is None:
-        return PartialDate(int(month), int(day))
-    else:
-        return datetime.date(int(year), int(month), int(day))
-
+class Lot(Node):
+    def __init__(self, cost=None, total=False, date=None, year=None, **kw):
+        super().__init__(**kw)
+        # The Amount paid per unit, or for all units when total is set.
+        self.cost = cost
+        self.total = total
+        if date is None:
+            self.ordinal = None
+        else:
+            self.ordinal = to_ordinal(date, year)
 
-class PartialDate:
-    # February is set to 29 days for leap years.
-    _days_in_month = [None, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    @property
+    def date(self):
+        if self.ordinal is None:
+            return None
+        return from_ordinal(self.ordinal)
 
-    def __init__(self, month, day):
-        self.replace(month, day)
 
-    def replace(self, month, day):
-        if 1 <= month <= 12:
-            self.month = month
-        else:
-            raise ValueError('month must be in 1..12', month)
-        dim = self._days_in_month[month]
-        if 1 <= day <= dim:
-            self.day = day
-        else:
-            raise ValueError('day must be in 1..{}'.format(dim), day)
-        return self
+class Price(Node):
+    def __init__(self, amount, total=False, **kw):
+        super().__init__(**kw)
+        # The Amount paid per unit, or for all units when total is set.
+        self.amount = amount
+        self.total = total
 
-    def isoformat(self):
-        return '{:02d}-{:02d}'.format(self.month, self.day)
 
-    def __str__(self):
-        return self.isoformat()
+class Expression(Node):
+    def __init__(self, kind, text, lineno=None, posting=None,
+                 generated=False, **kw):
+        super().__init__(**kw)
+        self.kind = kind
+        self.text = text
+        self.lineno = lineno
+        # The posting an expression added by an automated transaction
+        # refers to.
+        self.posting = posting
+        self.generated = generated
 
 
 class Note(Node):
-    def __init__(self, text, **kw):
+    def __init__(self, text, tags=None, **kw):
         super().__init__(**kw)
         self.text = text
         self.tags = {}
+        if tags is not None:
+            self.tags.update(tags)
 
 
 class Comment(Node):
-    def __init__(self, text, **kw):
+    def __init__(self, text, char=';', **kw):
         super().__init__(**kw)
         self.text = text
+        # The character the comment is written with.
+        self.char = char
+
+
+class Year(Node):
+    def __init__(self, year, **kw):
+        super().__init__(**kw)
+        self.year = year
 
 
 class EmptyLine(Node):
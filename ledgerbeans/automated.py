@@ -0,0 +1,100 @@
+import re
+
+from ledgerbeans import ast
+from ledgerbeans.report import posting_amounts
+
+
+def compile_patterns(patterns):
+    return re.compile('|'.join('(?:{})'.format(p) for p in patterns),
+                      re.IGNORECASE)
+
+
+class RuleMatcher:
+    # Finds the automated transactions whose patterns match an account.
+    # All patterns are combined into one regular expression that rejects
+    # accounts no rule matches with a single search, and the rules matching
+    # an account are looked up once and remembered, so the cost per posting
+    # does not grow with the number of rules.
+    def __init__(self):
+        self.rules = []
+        self.regex = None
+        self.cache = {}
+
+    def add(self, rule):
+        self.rules.append((compile_patterns(rule.patterns), rule))
+        self.regex = None
+        self.cache.clear()
+
+    def match(self, name):
+        try:
+            return self.cache[name]
+        except KeyError:
+            pass
+        if self.regex is None:
+            self.regex = compile_patterns(
+                [p for regex, rule in self.rules for p in rule.patterns])
+        if self.regex.search(name) is None:
+            rules = ()
+        else:
+            rules = tuple(rule for regex, rule in self.rules
+                          if regex.search(name) is not None)
+        self.cache[name] = rules
+        return rules
+
+    def apply(self, xact):
+        generated = []
+        for post, quantity, commodity in posting_amounts(xact):
+            if post.generated:
+                continue
+            for rule in self.match(post.account.name):
+                for template in rule:
+                    if isinstance(template, ast.Posting):
+                        generated.append(generate_posting(template, quantity,
+                                                          commodity))
+                    elif isinstance(template, ast.Expression):
+                        generated.append(ast.Expression(
+                            kind=template.kind,
+                            text=template.text,
+                            lineno=template.lineno,
+                            posting=post,
+                            generated=True))
+        for item in generated:
+            xact.append(item)
+
+    def feed(self, item):
+        # Automated transactions apply to the transactions after them.
+        if isinstance(item, ast.Transaction):
+            if self.rules:
+                self.apply(item)
+        elif isinstance(item, ast.AutomatedTransaction):
+            self.add(item)
+
+
+def generate_posting(template, quantity, commodity):
+    # An amount without a commodity is a factor of the matched amount.
+    amount = template.amount
+    if amount.symbol is None:
+        amount = ast.Amount(amount.amount * quantity, symbol=commodity)
+    else:
+        amount = ast.Amount(amount.amount, symbol=amount.symbol)
+    account = ast.Account(template.account.name,
+                          flags=template.account.flags)
+    return ast.Posting(account=account,
+                       amount=amount,
+                       note=template.note,
+                       status=template.status,
+                       generated=True)
+
+
+def automate(items):
+    # Applies automated transactions to a stream of items.
+    matcher = RuleMatcher()
+    for item in items:
+        matcher.feed(item)
+        yield item
+
+
+def automate_journal(journal):
+    matcher = RuleMatcher()
+    for item in journal:
+        matcher.feed(item)
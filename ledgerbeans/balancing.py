@@ -0,0 +1,84 @@
+from ledgerbeans import ast
+from ledgerbeans.report import (balance_amount, balance_group, format_amount,
+                                symbol_of)
+
+
+class UnbalancedError(Exception):
+    def __init__(self, message, lineno):
+        super().__init__(message, lineno)
+        self.message = message
+        self.lineno = lineno
+
+
+def infer(post, quantity, commodity):
+    post.amount = ast.Amount(-quantity, symbol=commodity)
+    post.inferred = True
+
+
+def balance_transaction(xact):
+    # Gives the posting without an amount the amount that balances its
+    # group, see report.balance_group(), and raises UnbalancedError when a
+    # group does not balance. Postings to virtual accounts in parentheses
+    # need not balance. Postings with a lot or a price count at its cost,
+    # see report.balance_amount(). A posting left without an amount needs
+    # more than one commodity, report.posting_amounts() splits it. A group
+    # with a balance assignment is checked once the assignment has its
+    # amount, see assertions.BalanceChecker.assign().
+    posts = [item for item in xact.children
+             if isinstance(item, ast.Posting)]
+    if len(posts) == 2:
+        # Most transactions move one amount between two real accounts.
+        first, second = posts
+        if not first.account.flags['virtual'] and \
+           not second.account.flags['virtual']:
+            if first.amount is None:
+                first, second = second, first
+            if first.amount is not None:
+                quantity, commodity = balance_amount(first)
+                if second.amount is None:
+                    if second.balance is None:
+                        infer(second, quantity, commodity)
+                    return
+                other, other_commodity = balance_amount(second)
+                if symbol_of(commodity) == symbol_of(other_commodity) and \
+                   quantity + other == 0:
+                    return
+    sums = {}
+    nulls = {}
+    assigned = set()
+    for post in posts:
+        group = balance_group(post.account)
+        if post.amount is None and post.balance is not None:
+            # The amount is assigned when balances are checked.
+            assigned.add(group)
+        elif post.amount is None:
+            if group in nulls:
+                raise UnbalancedError('Only one posting without an amount '
+                                      'allowed per transaction', post.lineno)
+            nulls[group] = post
+        elif group is not None:
+            group_sums = sums.setdefault(group, {})
+            amount, commodity = balance_amount(post)
+            symbol = symbol_of(commodity)
+            quantity, style = group_sums.get(symbol, (0, commodity))
+            group_sums[symbol] = (quantity + amount, style)
+    for group, group_sums in sums.items():
+        if group in assigned:
+            continue
+        post = nulls.get(group)
+        if post is not None:
+            if len(group_sums) == 1:
+                for quantity, commodity in group_sums.values():
+                    infer(post, quantity, commodity)
+            continue
+        residue = [(quantity, commodity)
+                   for quantity, commodity in group_sums.values()
+                   if quantity]
+        if not residue:
+            continue
+        if len(residue) == 2 and (residue[0][0] > 0) != (residue[1][0] > 0):
+            # Two commodities exchanged at the price their amounts imply.
+            continue
+        raise UnbalancedError('Transaction does not balance: {}'.format(
+            ', '.join(format_amount(quantity, commodity)
+                      for quantity, commodity in residue)), xact.lineno)
@@ -0,0 +1,178 @@
+import hashlib
+import heapq
+import logging
+import os
+import pickle
+
+from itertools import groupby
+
+from ledgerbeans.assertions import fingerprint
+from ledgerbeans.loader import date_key, sorted_transactions
+from ledgerbeans.period import period_start
+from ledgerbeans.report import Totals, posting_amounts
+from ledgerbeans.shard import cache_dirname, checksum
+
+
+logger = logging.getLogger(__name__)
+
+
+def month_key(xact):
+    return period_start(xact.ordinal, 'monthly')
+
+
+def add_postings(accounts, transactions):
+    for xact in transactions:
+        for post, quantity, commodity in posting_amounts(xact):
+            accounts.setdefault(post.account.name,
+                                Totals()).add(quantity, commodity)
+
+
+def copy_accounts(accounts):
+    copy = {}
+    for name, totals in accounts.items():
+        copy.setdefault(name, Totals()).update(totals)
+    return copy
+
+
+class Checkpoint:
+    # The per-account balances of the transactions before ordinal, the
+    # first day of a month. The digest covers the fingerprints of all those
+    # transactions, so it changes with every edit before ordinal and with
+    # no edit after it.
+    def __init__(self, ordinal, digest, accounts):
+        self.ordinal = ordinal
+        self.digest = digest
+        self.accounts = accounts
+
+
+# Saved with the checkpoints, those of another version are summed again.
+checkpoint_version = 1
+
+
+def build_checkpoints(transactions, saved=()):
+    # Returns the checkpoints at the start of every month of the
+    # transactions, taken in date order, after the first, and how many of
+    # them were kept from saved. A saved checkpoint is kept while every
+    # month before it has the same digest, the balances of the later ones
+    # are summed from the last one kept.
+    checkpoints = []
+    reused = 0
+    digest = hashlib.sha256()
+    accounts = None
+    previous = []
+    for ordinal, month in groupby(transactions, key=month_key):
+        if previous:
+            chain = digest.hexdigest()
+            i = len(checkpoints)
+            if accounts is None and i < len(saved) and \
+               saved[i].ordinal == ordinal and saved[i].digest == chain:
+                checkpoints.append(saved[i])
+                reused += 1
+            else:
+                if accounts is None:
+                    accounts = {}
+                    if checkpoints:
+                        accounts = copy_accounts(checkpoints[-1].accounts)
+                add_postings(accounts, previous)
+                checkpoints.append(Checkpoint(ordinal, chain,
+                                              copy_accounts(accounts)))
+        previous = list(month)
+        for xact in previous:
+            digest.update(repr(fingerprint(xact)).encode())
+    return checkpoints, reused
+
+
+def find_checkpoint(checkpoints, end=None):
+    # The last checkpoint on or before end.
+    found = None
+    for checkpoint in checkpoints:
+        if end is not None and checkpoint.ordinal > end:
+            break
+        found = checkpoint
+    return found
+
+
+def checkpoint_path(filename):
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, cache_dirname,
+                        name + '.checkpoints.pickle')
+
+
+def read_checkpoints(path):
+    # Returns the checksum of the file the checkpoints were saved for and
+    # the checkpoints, or (None, ()) when there are none.
+    try:
+        with open(path, 'rb') as f:
+            version, digest, checkpoints = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError,
+            TypeError):
+        return None, ()
+    if version != checkpoint_version:
+        return None, ()
+    return digest, checkpoints
+
+
+def write_checkpoints(path, digest, checkpoints):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump((checkpoint_version, digest, checkpoints), f,
+                    pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def journal_checkpoints(journal):
+    # Returns the checkpoints saved in the cache directory next to the
+    # ledger file of journal. While the file has the same checksum they are
+    # read back as they are, after an edit the checkpoints up to the first
+    # changed month are kept and the later ones summed again and saved.
+    path = checkpoint_path(journal.name)
+    digest = checksum(journal.name)
+    saved_digest, saved = read_checkpoints(path)
+    if saved_digest == digest:
+        return saved
+    checkpoints, reused = build_checkpoints(sorted_transactions(journal),
+                                            saved)
+    logger.info('Kept {} of {} balance checkpoints of {}'.format(
+        reused, len(checkpoints), journal.name))
+    try:
+        write_checkpoints(path, digest, checkpoints)
+    except OSError as e:
+        logger.warning('Cannot save balance checkpoints {}: {}'.format(
+            path, e))
+    return checkpoints
+
+
+def first_from(transactions, ordinal):
+    # The index of the first of the transactions, in date order, on or
+    # after ordinal.
+    lo, hi = 0, len(transactions)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if transactions[mid].ordinal < ordinal:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def checkpoint_transactions(journals, end=None, openings=None):
+    # Adds the balances of the last checkpoint before end of every journal
+    # to openings, and returns the transactions of the journals from it
+    # until end in date order. Journals without a ledger file on disk, such
+    # as standard input, start at their first transaction.
+    streams = []
+    for journal in journals:
+        transactions = sorted_transactions(journal)
+        start = 0
+        if os.path.isfile(journal.name):
+            found = find_checkpoint(journal_checkpoints(journal), end)
+            if found is not None:
+                for name, totals in found.accounts.items():
+                    openings.setdefault(name, Totals()).update(totals)
+                start = first_from(transactions, found.ordinal)
+        stop = len(transactions)
+        if end is not None:
+            stop = first_from(transactions, end)
+        streams.append(transactions[start:stop])
+    return heapq.merge(*streams, key=date_key)
@@ -1,31 +1,20 @@
 import logging
 
-from ply.yacc import NullLogger
-
-from ledgerbeans.lexer import LedgerLexer, LexError
-from ledgerbeans.parser import LedgerParser
-from ledgerbeans.printer import printer
+from ledgerbeans.loader import LoadError, load_all
+from ledgerbeans.printer import initialize, printer
 
 
 logger = logging.getLogger(__name__)
 
 
 def command_ast(args):
-    lexer = LedgerLexer(args.file)
-
-    if args.debug:
-        parser = LedgerParser(lexer, errorlog=logger, debug=logger)
-    else:
-        parser = LedgerParser(lexer, errorlog=NullLogger())
-
+    initialize()
     try:
-        ast = parser.parse()
-    except LexError as e:
-        logger.error('{}:{}:{}:{}'.format(e.state.file.name,
-                                          e.state.lineno,
-                                          e.state.lexpos + 1,
-                                          e.message))
+        journals = load_all(args.files, debug=args.debug, jobs=args.jobs,
+                            trivia=args.trivia)
+    except LoadError as e:
+        logger.error(str(e))
     else:
-        # TODO write to args.output.
-        for line in printer(ast):
-            args.output.write(line + '\n')
+        for ast in journals:
+            for line in printer(ast):
+                args.output.write(line + '\n')
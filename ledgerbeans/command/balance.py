@@ -0,0 +1,65 @@
+import logging
+
+from ledgerbeans.checkpoint import checkpoint_transactions
+from ledgerbeans.loader import LoadError, load_all, merge_transactions
+from ledgerbeans.periodic import check_forecast, forecast_transactions
+from ledgerbeans.report import (Query, balance_lines, balance_report,
+                                date_range, has_item_terms)
+from ledgerbeans.snapshot import (is_snapshot, open_snapshots,
+                                  snapshot_balances)
+
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_balance(args):
+    if has_item_terms(args.patterns):
+        logger.error('Snapshots only select postings by account, use the '
+                     'ledger files')
+        return
+    try:
+        snapshots = open_snapshots(args.files)
+    except LoadError as e:
+        logger.error(str(e))
+        return
+    accounts = snapshot_balances(snapshots, args.patterns, args.begin,
+                                 args.end)
+    for line in balance_lines(accounts):
+        args.output.write(line + '\n')
+
+
+def command_balance(args):
+    if all(is_snapshot(f.name) for f in args.files):
+        if args.forecast:
+            logger.error('Snapshots have no periodic transactions, use the '
+                         'ledger files')
+            return
+        return snapshot_balance(args)
+    # Without a begin date the balances of shards before the last one come
+    # from the manifest, and with --checkpoints those before the last
+    # checkpoint from its sidecar file, unless postings are selected by more
+    # than their account.
+    openings = None
+    if args.begin is None and not has_item_terms(args.patterns):
+        openings = {}
+    try:
+        if args.forecast:
+            check_forecast(args.files)
+        journals = load_all(args.files, debug=args.debug, jobs=args.jobs,
+                            begin=args.begin, end=args.end,
+                            openings=openings, trivia=args.trivia)
+    except LoadError as e:
+        logger.error(str(e))
+    else:
+        if args.checkpoints and openings is not None:
+            transactions = checkpoint_transactions(journals, args.end,
+                                                   openings)
+        else:
+            transactions = merge_transactions(journals)
+        if args.forecast:
+            transactions = forecast_transactions(journals, args.begin,
+                                                 args.end, transactions)
+        transactions = date_range(transactions, args.begin, args.end)
+        query = Query(args.patterns, journals, args.keep_index)
+        for line in balance_report(transactions, query, openings):
+            args.output.write(line + '\n')
@@ -0,0 +1,34 @@
+import logging
+import socket
+
+from ledgerbeans import protocol
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_client(args):
+    if not args.query:
+        logger.error('Missing query')
+        return
+    socket_path = args.socket or protocol.default_socket_path()
+    request = {'command': args.query[0], 'args': args.query[1:]}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(protocol.encode(request))
+        line = sock.makefile('rb').readline()
+    except OSError as e:
+        logger.error('{}:{}'.format(socket_path, e))
+        return
+    finally:
+        sock.close()
+    if not line:
+        logger.error('{}:Connection closed by server'.format(socket_path))
+        return
+    response = protocol.decode(line)
+    if response['status'] == 'ok':
+        for line in response['output']:
+            args.output.write(line + '\n')
+    else:
+        logger.error(response['message'])
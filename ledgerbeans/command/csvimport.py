@@ -0,0 +1,55 @@
+import logging
+
+from ledgerbeans.csvimport import (FingerprintIndex, Rules, RulesError,
+                                   import_transactions)
+from ledgerbeans.loader import LoadError, load_all
+from ledgerbeans.writer import transaction_lines
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_import(args):
+    rules_name = args.rules or args.csv + '.rules'
+    if args.append and args.files[0].name.startswith('<'):
+        logger.error('Cannot append to {}'.format(args.files[0].name))
+        return
+    try:
+        with open(rules_name) as f:
+            rules = Rules(f)
+    except (OSError, RulesError) as e:
+        logger.error(str(e))
+        return
+
+    try:
+        journals = load_all(args.files, debug=args.debug, jobs=args.jobs)
+    except LoadError as e:
+        logger.error(str(e))
+        return
+    index = FingerprintIndex(args.date_window)
+    for journal in journals:
+        for xact in journal.transactions():
+            index.add_transaction(xact)
+
+    try:
+        with open(args.csv, newline='') as f:
+            transactions = [xact for row, xact in
+                            import_transactions(f, rules, index)]
+    except (OSError, RulesError) as e:
+        logger.error('{}:{}'.format(args.csv, e))
+        return
+    transactions.sort(key=lambda xact: xact.ordinal)
+    logger.info('Importing {} new transactions'.format(len(transactions)))
+
+    if args.append:
+        output = open(args.files[0].name, 'a')
+    else:
+        output = args.output
+    try:
+        for xact in transactions:
+            output.write('\n')
+            for line in transaction_lines(xact):
+                output.write(line + '\n')
+    finally:
+        if args.append:
+            output.close()
@@ -0,0 +1,33 @@
+import logging
+
+from ledgerbeans.loader import LoadError, load_all, merge_transactions
+from ledgerbeans.lots import LotError, gains_report
+from ledgerbeans.periodic import check_forecast, forecast_transactions
+from ledgerbeans.report import Query
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_gains(args):
+    # Lots bought before the report period are needed to match its sales,
+    # so all shards up to its end are loaded.
+    try:
+        if args.forecast:
+            check_forecast(args.files)
+        journals = load_all(args.files, debug=args.debug, jobs=args.jobs,
+                            end=args.end, trivia=args.trivia)
+    except LoadError as e:
+        logger.error(str(e))
+        return
+    query = Query(args.patterns, journals, args.keep_index)
+    transactions = merge_transactions(journals)
+    if args.forecast:
+        transactions = forecast_transactions(journals, args.begin, args.end,
+                                             transactions)
+    try:
+        for line in gains_report(transactions, query,
+                                 args.method, args.begin, args.end):
+            args.output.write(line + '\n')
+    except LotError as e:
+        logger.error('{}:{}:{}'.format(e.filename, e.lineno, e.message))
@@ -0,0 +1,16 @@
+import logging
+
+from ledgerbeans.loader import LoadError, load_items
+from ledgerbeans.writer import write_items
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_print(args):
+    try:
+        for f in args.files:
+            write_items(load_items(f, debug=args.debug), args.output,
+                        amount_column=args.amount_column)
+    except LoadError as e:
+        logger.error(str(e))
@@ -0,0 +1,53 @@
+import logging
+
+from ledgerbeans.loader import LoadError, load_all, merge_transactions
+from ledgerbeans.periodic import check_forecast, forecast_transactions
+from ledgerbeans.report import (Query, date_range, has_item_terms,
+                                register_lines, register_report)
+from ledgerbeans.snapshot import (is_snapshot, open_snapshots,
+                                  snapshot_register_rows)
+
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_register(args):
+    if has_item_terms(args.patterns):
+        logger.error('Snapshots only select postings by account, use the '
+                     'ledger files')
+        return
+    try:
+        snapshots = open_snapshots(args.files)
+    except LoadError as e:
+        logger.error(str(e))
+        return
+    rows = snapshot_register_rows(snapshots, args.patterns, args.begin,
+                                  args.end)
+    for line in register_lines(rows):
+        args.output.write(line + '\n')
+
+
+def command_register(args):
+    if all(is_snapshot(f.name) for f in args.files):
+        if args.forecast:
+            logger.error('Snapshots have no periodic transactions, use the '
+                         'ledger files')
+            return
+        return snapshot_register(args)
+    try:
+        if args.forecast:
+            check_forecast(args.files)
+        journals = load_all(args.files, debug=args.debug, jobs=args.jobs,
+                            begin=args.begin, end=args.end,
+                            trivia=args.trivia)
+    except LoadError as e:
+        logger.error(str(e))
+    else:
+        transactions = merge_transactions(journals)
+        if args.forecast:
+            transactions = forecast_transactions(journals, args.begin,
+                                                 args.end, transactions)
+        transactions = date_range(transactions, args.begin, args.end)
+        query = Query(args.patterns, journals, args.keep_index)
+        for line in register_report(transactions, query):
+            args.output.write(line + '\n')
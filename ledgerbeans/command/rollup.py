@@ -0,0 +1,46 @@
+import logging
+
+from ledgerbeans.loader import (LoadError, load_all, stream_all,
+                                stream_transactions)
+from ledgerbeans.periodic import check_forecast, forecast_transactions
+from ledgerbeans.report import Query, date_range, has_item_terms
+from ledgerbeans.rollup import rollup_report
+from ledgerbeans.shard import is_manifest
+
+
+logger = logging.getLogger(__name__)
+
+
+def loaded_transactions(args):
+    # Selecting postings by more than their account takes the indexes of
+    # whole journals, and forecasting their periodic transactions, shard
+    # manifests are journals of journals.
+    journals = load_all(args.files, debug=args.debug, jobs=args.jobs,
+                        begin=args.begin, end=args.end, trivia=args.trivia)
+    transactions = stream_transactions(journals)
+    if args.forecast:
+        transactions = forecast_transactions(journals, args.begin, args.end,
+                                             transactions)
+    return transactions, Query(args.patterns, journals, args.keep_index)
+
+
+def command_rollup(args):
+    # Transactions are parsed while they are reported, so memory is bounded
+    # by the reorder buffer instead of the size of the journal.
+    try:
+        if args.forecast:
+            check_forecast(args.files)
+        if args.forecast or has_item_terms(args.patterns) or \
+           any(is_manifest(f.name) for f in args.files):
+            transactions, query = loaded_transactions(args)
+        else:
+            transactions = stream_all(args.files, debug=args.debug,
+                                      trivia=args.trivia)
+            query = Query(args.patterns)
+        transactions = date_range(transactions, args.begin, args.end)
+        for line in rollup_report(transactions, args.period, query,
+                                  window=args.reorder_window,
+                                  limit=args.buffer_size):
+            args.output.write(line + '\n')
+    except LoadError as e:
+        logger.error(str(e))
@@ -0,0 +1,27 @@
+import logging
+
+from ledgerbeans.printer import initialize
+from ledgerbeans.protocol import default_socket_path
+from ledgerbeans.server import JournalServer
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_serve(args):
+    for f in args.files:
+        if f.name.startswith('<'):
+            logger.error('Cannot serve a journal read from {}'.format(f.name))
+            return
+        f.close()
+    initialize()
+    server = JournalServer([f.name for f in args.files],
+                           args.socket or default_socket_path(),
+                           interval=args.interval, debug=args.debug,
+                           jobs=args.jobs)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        logger.error(str(e))
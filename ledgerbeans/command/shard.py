@@ -0,0 +1,30 @@
+import logging
+
+from ledgerbeans.loader import LoadError
+from ledgerbeans.shard import Manifest, is_manifest, refresh, split
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_shard(args):
+    if len(args.files) != 1:
+        logger.error('Can only shard one ledger file at a time')
+        return
+    if not is_manifest(args.manifest):
+        logger.error('Manifest name must end in .json')
+        return
+    f = args.files[0]
+    manifest = Manifest(args.manifest)
+    try:
+        split(f, manifest, args.period)
+    except (OSError, ValueError) as e:
+        logger.error('{}:{}'.format(f.name, e))
+        return
+    try:
+        refresh(manifest, manifest.shards, debug=args.debug, jobs=args.jobs)
+    except LoadError as e:
+        logger.error(str(e))
+        return
+    manifest.write()
+    logger.info('Wrote {} shards'.format(len(manifest.shards)))
@@ -0,0 +1,21 @@
+import logging
+
+from ledgerbeans.loader import LoadError, load_all
+from ledgerbeans.snapshot import is_snapshot, source_files, write_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_snapshot(args):
+    if not is_snapshot(args.snapshot):
+        logger.error('Snapshot name must end in .snapshot')
+        return
+    try:
+        sources = source_files(args.files)
+        journals = load_all(args.files, debug=args.debug, jobs=args.jobs)
+        write_snapshot(args.snapshot, journals, sources)
+    except LoadError as e:
+        logger.error(str(e))
+    except (OSError, ValueError) as e:
+        logger.error('{}:{}'.format(args.snapshot, e))
@@ -0,0 +1,21 @@
+import logging
+
+from ledgerbeans.compressed import open_input
+from ledgerbeans.sort import sort_entries
+
+
+logger = logging.getLogger(__name__)
+
+
+def command_sort(args):
+    if len(args.files) != 1:
+        logger.error('Can only sort one ledger file at a time')
+        return
+    f = args.files[0]
+    # Read the lines as they are, line endings included.
+    f.reconfigure(newline='')
+    try:
+        for text in sort_entries(open_input(f), args.buffer_size * 2**20):
+            args.output.write(text)
+    except (OSError, ValueError) as e:
+        logger.error('{}:{}'.format(f.name, e))
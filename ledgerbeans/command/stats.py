@@ -0,0 +1,44 @@
+import logging
+
+from ledgerbeans.compressed import open_input
+from ledgerbeans.loader import LoadError, load_items
+from ledgerbeans.shard import Manifest, is_manifest
+from ledgerbeans.snapshot import is_snapshot
+from ledgerbeans.stats import LineCounter, Stats
+
+
+logger = logging.getLogger(__name__)
+
+
+def ledger_files(files):
+    # Opens the shards of manifests in their place.
+    for f in files:
+        if is_manifest(f.name):
+            f.close()
+            manifest = Manifest.read(f.name)
+            for shard in manifest.shards:
+                with open(manifest.path(shard)) as shard_file:
+                    yield shard_file
+        else:
+            yield f
+
+
+def command_stats(args):
+    if any(is_snapshot(f.name) for f in args.files):
+        logger.error('Stats are taken from ledger files, not snapshots')
+        return
+    stats = Stats()
+    try:
+        for f in ledger_files(args.files):
+            counter = LineCounter(open_input(f))
+            for item in load_items(counter, debug=args.debug):
+                stats.add_item(item)
+            stats.add_lines(counter)
+    except LoadError as e:
+        logger.error(str(e))
+        return
+    except OSError as e:
+        logger.error(str(e))
+        return
+    for line in stats.report():
+        args.output.write(line + '\n')
@@ -0,0 +1,141 @@
+import codecs
+import importlib
+import io
+import queue
+import threading
+
+
+# The modules opening each format are imported when a file needs them, so
+# lexing plain files does not pay for them, or for the reader thread.
+formats = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+]
+
+buffer_size = 1 << 20
+
+# Chunks decompressed ahead of the lexer.
+queue_size = 8
+
+
+def compression(filename):
+    # Returns the function opening filename as a decompressed binary stream,
+    # or None when the file is not compressed.
+    try:
+        with open(filename, 'rb') as f:
+            head = f.read(6)
+    except OSError:
+        return None
+    for magic, module in formats:
+        if head.startswith(magic):
+            return importlib.import_module(module).open
+    return None
+
+
+def put(chunks, stop, chunk):
+    # Gives up when the reader of the chunks is gone.
+    while not stop.is_set():
+        try:
+            chunks.put(chunk, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def decompress(opener, filename, encoding, errors, chunks, stop):
+    # Runs in the reader thread. The decompressors release the GIL, so
+    # decompressing the next chunk overlaps with lexing the last one.
+    # Chunks are lists of lines, ending with None at the end of the file
+    # or with the exception that ended reading.
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    rest = ''
+    try:
+        with opener(filename, 'rb') as f:
+            while True:
+                data = f.read(buffer_size)
+                text = rest + decoder.decode(data, final=not data)
+                lines = text.split('\n')
+                rest = lines.pop()
+                lines = [line + '\n' for line in lines]
+                if not data and rest:
+                    lines.append(rest)
+                put(chunks, stop, lines)
+                if not data or stop.is_set():
+                    break
+        put(chunks, stop, None)
+    except Exception as e:
+        # Such as zlib.error for a corrupt gzip stream. The reader always
+        # gets an end, or it would wait for the next chunk forever.
+        put(chunks, stop, e)
+
+
+class DecompressedFile:
+    # Iterates over the lines of a compressed file like a text file opened
+    # with newline='', while a thread reads and decompresses ahead.
+    def __init__(self, opener, name, encoding='utf-8', errors='strict'):
+        self.name = name
+        self.lines = iter(())
+        self.chunks = queue.Queue(queue_size)
+        self.stop = threading.Event()
+        self.done = False
+        self.thread = threading.Thread(target=decompress,
+                                       args=(opener, name, encoding, errors,
+                                             self.chunks, self.stop),
+                                       daemon=True)
+        self.thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            line = next(self.lines, None)
+            if line is not None:
+                return line
+            if self.done:
+                raise StopIteration
+            chunk = self.next_chunk()
+            if chunk is None:
+                self.done = True
+            elif isinstance(chunk, Exception):
+                self.done = True
+                raise OSError('Cannot decompress {}: {}'.format(self.name,
+                                                                chunk))
+            else:
+                self.lines = iter(chunk)
+
+    def next_chunk(self):
+        # Waits for the next chunk while the reader thread is alive.
+        while True:
+            try:
+                return self.chunks.get(timeout=0.1)
+            except queue.Empty:
+                if not self.thread.is_alive():
+                    break
+        try:
+            return self.chunks.get_nowait()
+        except queue.Empty:
+            return RuntimeError('reader thread ended')
+
+    def close(self):
+        self.stop.set()
+
+    def __del__(self):
+        self.stop.set()
+
+
+def open_input(f):
+    # Returns f, or a stream of its decompressed lines when it is a
+    # compressed file, which is closed in its place.
+    name = getattr(f, 'name', None)
+    if not isinstance(f, io.TextIOBase) or not isinstance(name, str) or \
+       name.startswith('<'):
+        return f
+    opener = compression(name)
+    if opener is None:
+        return f
+    encoding = getattr(f, 'encoding', None) or 'utf-8'
+    errors = getattr(f, 'errors', None) or 'strict'
+    f.close()
+    return DecompressedFile(opener, name, encoding, errors)
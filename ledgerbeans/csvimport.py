@@ -0,0 +1,222 @@
+import configparser
+import csv
+import datetime
+import re
+
+from collections import Counter
+from decimal import Decimal
+
+from ledgerbeans import ast
+from ledgerbeans.report import posting_amounts
+
+
+class RulesError(Exception):
+    pass
+
+
+class Rules:
+    # Rules files are INI files. The [csv] section maps columns, given as
+    # 1-based numbers or header names, and the [accounts] section maps
+    # regular expressions on the description to the contra account:
+    #
+    #   [csv]
+    #   header = yes
+    #   date = Date
+    #   date-format = %d-%m-%Y
+    #   description = Name
+    #   amount = Amount
+    #   account = Assets:Bank
+    #   commodity = EUR
+    #
+    #   [accounts]
+    #   AMAZON = Expenses:Shopping
+    #   default = Expenses:Unknown
+    def __init__(self, f):
+        config = configparser.ConfigParser(delimiters=('=',),
+                                           comment_prefixes=('#', ';'),
+                                           interpolation=None)
+        config.optionxform = str
+        try:
+            config.read_file(f)
+            options = config['csv']
+        except (configparser.Error, KeyError) as e:
+            raise RulesError('{}:{}'.format(f.name, e))
+        try:
+            self.date = options['date']
+            self.description = options['description']
+            self.account = options['account']
+        except KeyError as e:
+            raise RulesError('{}:Missing option {} in [csv]'.format(f.name,
+                                                                    e))
+        self.header = options.getboolean('header', fallback=False)
+        self.skip = options.getint('skip', fallback=0)
+        self.delimiter = options.get('delimiter', ',')
+        self.date_format = options.get('date-format', '%Y-%m-%d')
+        self.amount = options.get('amount')
+        self.debit = options.get('debit')
+        self.credit = options.get('credit')
+        if self.amount is None and self.debit is None and \
+           self.credit is None:
+            raise RulesError('{}:Missing option amount, or debit and '
+                             'credit, in [csv]'.format(f.name))
+        self.decimal_mark = options.get('decimal-mark', '.')
+        self.commodity = options.get('commodity')
+        self.code = options.get('code')
+        self.default_account = None
+        self.accounts = []
+        if config.has_section('accounts'):
+            for pattern, account in config['accounts'].items():
+                if pattern == 'default':
+                    self.default_account = account
+                else:
+                    self.accounts.append((re.compile(pattern, re.IGNORECASE),
+                                          account))
+        if self.default_account is None:
+            self.default_account = 'Expenses:Unknown'
+
+    def account_for(self, description):
+        for regex, account in self.accounts:
+            if regex.search(description):
+                return account
+        return self.default_account
+
+
+def normalize_description(text):
+    return ' '.join(re.sub(r'[^\w]+', ' ', text.casefold()).split())
+
+
+class FingerprintIndex:
+    # Counts postings by amount, commodity, account and normalized
+    # description per date. A row is a duplicate when an unclaimed posting
+    # with the same fingerprint exists within window days of its date,
+    # which costs 2 * window + 1 lookups whatever the size of the history.
+    def __init__(self, window=0):
+        self.window = window
+        self.counts = Counter()
+        self.styles = {}
+
+    def fingerprint(self, ordinal, quantity, commodity, account,
+                    description):
+        symbol = commodity[0] if commodity is not None else None
+        return (ordinal, quantity, symbol, account,
+                normalize_description(description))
+
+    def add_transaction(self, xact):
+        for post, quantity, commodity in posting_amounts(xact):
+            if commodity is not None:
+                self.styles.setdefault(commodity[0], commodity)
+            key = self.fingerprint(xact.ordinal, quantity, commodity,
+                                   post.account.name, xact.description)
+            self.counts[key] += 1
+
+    def claim(self, ordinal, quantity, commodity, account, description):
+        key = self.fingerprint(ordinal, quantity, commodity, account,
+                               description)
+        # Try the exact date first, then further away.
+        for offset in sorted(range(-self.window, self.window + 1), key=abs):
+            candidate = (ordinal + offset,) + key[1:]
+            if self.counts[candidate] > 0:
+                self.counts[candidate] -= 1
+                return True
+        return False
+
+
+def commodity_style(symbol, styles):
+    if symbol is None:
+        return None
+    try:
+        return styles[symbol]
+    except KeyError:
+        pass
+    if len(symbol) == 1 and not symbol.isalpha():
+        return (symbol, 'P')
+    return (symbol, 'S')
+
+
+def parse_quantity(text, decimal_mark='.'):
+    text = text.strip()
+    if decimal_mark == ',':
+        text = text.replace('.', '').replace(',', '.')
+    else:
+        text = text.replace(',', '')
+    text = re.sub(r'[^\d.+-]', '', text)
+    if not text:
+        return None
+    return Decimal(text)
+
+
+class Row:
+    def __init__(self, rules, fields, lineno):
+        self.rules = rules
+        self.fields = fields
+        self.lineno = lineno
+
+    def get(self, column):
+        if column is None:
+            return None
+        if column.isdecimal():
+            try:
+                return self.fields[int(column) - 1]
+            except (IndexError, KeyError):
+                raise RulesError('Line {}:No column {}'.format(self.lineno,
+                                                               column))
+        try:
+            return self.fields[column]
+        except (KeyError, TypeError):
+            raise RulesError('Line {}:No column {!r}'.format(self.lineno,
+                                                             column))
+
+    def quantity(self):
+        mark = self.rules.decimal_mark
+        if self.rules.amount is not None:
+            quantity = parse_quantity(self.get(self.rules.amount), mark)
+        else:
+            debit = parse_quantity(self.get(self.rules.debit) or '', mark)
+            credit = parse_quantity(self.get(self.rules.credit) or '', mark)
+            quantity = (credit or 0) - (debit or 0)
+        if quantity is None:
+            raise RulesError('Line {}:Missing amount'.format(self.lineno))
+        return quantity
+
+    def date(self):
+        text = self.get(self.rules.date).strip()
+        try:
+            return datetime.datetime.strptime(text,
+                                              self.rules.date_format).date()
+        except ValueError as e:
+            raise RulesError('Line {}:{}'.format(self.lineno, e))
+
+
+def read_rows(f, rules):
+    if rules.header:
+        reader = csv.DictReader(f, delimiter=rules.delimiter)
+    else:
+        reader = csv.reader(f, delimiter=rules.delimiter)
+    for i, fields in enumerate(reader):
+        if i < rules.skip or not fields:
+            continue
+        yield Row(rules, fields, reader.line_num)
+
+
+def import_transactions(f, rules, index):
+    # Yields (row, transaction) for rows not yet in the index.
+    for row in read_rows(f, rules):
+        date = row.date()
+        quantity = row.quantity()
+        description = row.get(rules.description).strip()
+        commodity = commodity_style(rules.commodity, index.styles)
+        if index.claim(date.toordinal(), quantity, commodity, rules.account,
+                       description):
+            continue
+        posting = ast.Posting(account=ast.Account(rules.account),
+                              amount=ast.Amount(quantity, symbol=commodity))
+        contra = ast.Posting(account=ast.Account(
+            rules.account_for(description)), amount=None)
+        code = row.get(rules.code)
+        if code is not None:
+            code = code.strip() or None
+        xact = ast.Transaction(date=date,
+                               description=description,
+                               code=code,
+                               children=[posting, contra])
+        yield row, xact
@@ -0,0 +1,97 @@
+import datetime
+
+
+# Dates are interned: every distinct date is parsed once and transactions
+# keep its proleptic Gregorian ordinal, so sorting and comparing dates
+# compares integers.
+_ordinals = {}
+_dates = {}
+
+
+def current_year():
+    return datetime.date.today().year
+
+
+def to_ordinal(date, year=None):
+    if isinstance(date, datetime.date):
+        return date.toordinal()
+    if isinstance(date, PartialDate):
+        return date.toordinal(year)
+    if date[0] is None:
+        # Partial dates take the year of the last year directive, or the
+        # current year like ledger does.
+        if year is None:
+            year = current_year()
+        key = (year, date[1], date[2])
+    else:
+        key = date
+    try:
+        return _ordinals[key]
+    except KeyError:
+        pass
+    ordinal = datetime.date(int(key[0]), int(key[1]),
+                            int(key[2])).toordinal()
+    _ordinals[key] = ordinal
+    return ordinal
+
+
+def parse_date(text):
+    # Parses dates given on the command line, where the month and day may
+    # be left out to mean the first one.
+    for c in ['-', '.']:
+        text = text.replace(c, '/')
+    parts = text.split('/')
+    if not 1 <= len(parts) <= 3 or not all(p.isdecimal() for p in parts):
+        raise ValueError('Invalid date {!r}'.format(text))
+    parts.extend(['1'] * (3 - len(parts)))
+    return to_ordinal(tuple(parts))
+
+
+def from_ordinal(ordinal):
+    try:
+        return _dates[ordinal]
+    except KeyError:
+        date = _dates[ordinal] = datetime.date.fromordinal(ordinal)
+        return date
+
+
+def create_date(date_tuple, year=None):
+    if date_tuple is None:
+        return None
+    if date_tuple[0] is None and year is None:
+        return PartialDate(int(date_tuple[1]), int(date_tuple[2]))
+    return from_ordinal(to_ordinal(date_tuple, year))
+
+
+class PartialDate:
+    # February is set to 29 days for leap years.
+    _days_in_month = [None, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+    def __init__(self, month, day):
+        self.replace(month, day)
+
+    def replace(self, month, day):
+        if 1 <= month <= 12:
+            self.month = month
+        else:
+            raise ValueError('month must be in 1..12', month)
+        dim = self._days_in_month[month]
+        if 1 <= day <= dim:
+            self.day = day
+        else:
+            raise ValueError('day must be in 1..{}'.format(dim), day)
+        return self
+
+    def resolve(self, year=None):
+        if year is None:
+            year = current_year()
+        return datetime.date(year, self.month, self.day)
+
+    def toordinal(self, year=None):
+        return self.resolve(year).toordinal()
+
+    def isoformat(self):
+        return '{:02d}-{:02d}'.format(self.month, self.day)
+
+    def __str__(self):
+        return self.isoformat()
@@ -0,0 +1,66 @@
+from ledgerbeans.date import to_ordinal
+
+
+def is_year_directive(line):
+    return line.startswith('Y') or line.startswith('year')
+
+
+def header_date(line, year=None):
+    word = line.split(None, 1)[0]
+    text = word.split('=', 1)[0]
+    for c in ['-', '.']:
+        text = text.replace(c, '/')
+    parts = text.split('/')
+    if len(parts) == 3:
+        return to_ordinal(tuple(parts))
+    elif len(parts) == 2:
+        return to_ordinal((None, parts[0], parts[1]), year)
+    raise ValueError('Invalid date {!r}'.format(word))
+
+
+class Entry:
+    def __init__(self, ordinal, lines, lineno):
+        self.ordinal = ordinal
+        self.lines = lines
+        self.lineno = lineno
+
+    def text(self):
+        return ''.join(self.lines)
+
+
+def read_entries(f):
+    # Splits a ledger file into its raw text entries without parsing them.
+    # Consecutive comments, empty lines and directives form an entry
+    # without a date, the lines of a transaction one with its date.
+    year = None
+    lines = []
+    ordinal = None
+    lineno = None
+    for i, line in enumerate(f, 1):
+        char = line[:1]
+        if char.isdigit():
+            if lines:
+                yield Entry(ordinal, lines, lineno)
+                lines = []
+            try:
+                ordinal = header_date(line, year)
+            except ValueError as e:
+                raise ValueError('Line {}:{}'.format(i, e))
+        elif ordinal is not None and char in ' \t' and line.strip():
+            pass
+        else:
+            if ordinal is not None:
+                yield Entry(ordinal, lines, lineno)
+                lines = []
+                ordinal = None
+            if is_year_directive(line):
+                parts = line.split()
+                if len(parts) > 1:
+                    year = int(parts[-1])
+                elif len(line) > 1:
+                    year = int(line[1:])
+        if not lines:
+            lineno = i
+        lines.append(line)
+    if lines:
+        yield Entry(ordinal, lines, lineno)
@@ -1,6 +1,9 @@
 from collections import deque
 
 import logging
+import sys
+
+from ledgerbeans.compressed import open_input
 
 
 logger = logging.getLogger(__name__)
@@ -29,14 +32,14 @@ class LexError(Exception):
 
 class LexState:
     def __init__(self, f):
-        self.file = f
+        # Compressed files are decompressed while they are lexed.
+        self.file = open_input(f)
         self.line = None
         self.lineno = 0
         self.linelen = 0
         self.lexpos = 0
         self.tokens = deque()
         self.directive = None
-        self.null_amount_posting = False
 
     def __iter__(self):
         return self
@@ -163,6 +166,8 @@ class LedgerLexer:
         '*': 'comment_directive',
         '|': 'comment_directive',
         '-': 'option_directive',
+        '=': 'auto_xact_directive',
+        '~': 'periodic_xact_directive',
         '0': 'xact_directive',
         '1': 'xact_directive',
         '2': 'xact_directive',
@@ -173,6 +178,8 @@ class LedgerLexer:
         '7': 'xact_directive',
         '8': 'xact_directive',
         '9': 'xact_directive',
+        'Y': 'year_directive',
+        'y': 'year_directive',
     }
 
     flag_dict = {
@@ -192,6 +199,13 @@ class LedgerLexer:
         'expr': 'EXPR'
     }
 
+    # Annotations written after the amount of a posting.
+    annotation_dict = {
+        '{': 'tokenize_lot_cost',
+        '[': 'tokenize_lot_date',
+        '@': 'tokenize_price',
+    }
+
     marker_list = ['.', ',']
 
     sign_list = ['-', '+']
@@ -205,17 +219,34 @@ class LedgerLexer:
         'EMPTYLINE', 'EOF',
         'COMMENT',
         'OPTION', 'ARGUMENT',
+        'YEAR',
+        'AUTOXACT', 'PERIODIC',
         'DATE', 'AUXDATE', 'CODE',
-        'DESCRIPTION', 'NOTE', 'TEXT',
+        'DESCRIPTION', 'NOTE', 'TEXT', 'TAG',
         'INDENT', 'ACCOUNT',
-        'VALEXPR', 'AMOUNT', 'SYMBOL',
+        'VALEXPR', 'AMOUNT', 'SYMBOL', 'BALANCE',
+        'COST', 'LOTDATE', 'PRICE',
     ] + list(flag_dict.values()) + \
         [a for a, b, c in account_dict.values()] + \
         list(expression_dict.values())
 
-    def __init__(self, f):
+    entry_tokens = {'EMPTYLINE', 'EOF', 'COMMENT', 'OPTION', 'YEAR',
+                    'AUTOXACT', 'PERIODIC', 'DATE'}
+
+    def __init__(self, f, trivia=True):
+        # Without trivia, comments and empty lines are dropped as their
+        # lines are classified, so reports do not pay for tokens and nodes
+        # they never look at. They still end the transaction before them.
         self.stack = []
         self.state = LexState(f)
+        self.handlers = {char: getattr(self, name)
+                         for char, name in self.directive_dict.items()}
+        self.empty_handler = self.emptyline
+        if not trivia:
+            for char, name in self.directive_dict.items():
+                if name == 'comment_directive':
+                    self.handlers[char] = self.skip_comment
+            self.empty_handler = self.skip_emptyline
 
     def __iter__(self):
         return self
@@ -232,25 +263,44 @@ class LedgerLexer:
         return self.state.lexpos
 
     def token(self):
-        try:
-            return self.state.get_token()
-        except IndexError:
+        handlers = self.handlers
+        empty_handler = self.empty_handler
+        while True:
+            state = self.state
+            if state is None:
+                # Reached EOF of last state in stack
+                return None
+            if state.tokens:
+                return state.tokens.popleft()
             try:
-                line = next(self.state)
+                line = next(state)
             except StopIteration:
                 return self.eof()
+            if not line:
+                empty_handler()
+                continue
             try:
-                char = line[0]
-            except IndexError:
-                self.emptyline()
-                return self.token()
-            if char in self.directive_dict:
-                getattr(self, self.directive_dict[char])()
-                return self.token()
-            return None
-        except AttributeError:
-            # Reached EOF of last state in stack
-            return None
+                handler = handlers[line[0]]
+            except KeyError:
+                return None
+            handler()
+
+    def entries(self):
+        # Yields the tokens of one logical entry at a time, such as a
+        # transaction header with all of its postings, a comment or an
+        # empty line.
+        entry_tokens = self.entry_tokens
+        entry = []
+        while True:
+            token = self.token()
+            if token is None:
+                break
+            if token.type in entry_tokens and entry:
+                yield entry
+                entry = []
+            entry.append(token)
+        if entry:
+            yield entry
 
     def next(self):
         token = self.token()
@@ -263,6 +313,9 @@ class LedgerLexer:
         self.state.add_token(LexToken('EMPTYLINE', None,
                                       self.state.lineno, self.state.lexpos))
 
+    def skip_emptyline(self):
+        self.state.directive = 'emptyline'
+
     def eof(self):
         filename = self.state.file.name
         lineno = self.state.lineno
@@ -355,18 +408,24 @@ class LedgerLexer:
         # This only advances lexpos while lexing a virtual posting.
         self.state.lexpos = pos
         word = self.state.next_word(hard_sep=True, skip=skip)
-        if word is not None:
+        if word is not None and word[0] != '=':
             if word[0] == '(':
                 tokens = self.tokenize_amount_expression()
                 self.state.add_tokens(tokens)
             else:
                 tokens = self.tokenize_amount(word)
                 self.state.add_tokens(tokens)
-
             word = self.state.next_word(skip=False)
-            if word is not None:
-                print('----')
-                print(word)
+        while word is not None and word[0] in self.annotation_dict:
+            tokens = getattr(self, self.annotation_dict[word[0]])()
+            self.state.add_tokens(tokens)
+            word = self.state.next_word(skip=False)
+        if word is not None and word[0] == '=':
+            tokens = self.tokenize_balance()
+            self.state.add_tokens(tokens)
+            word = self.state.next_word(skip=False)
+        if word is not None:
+            raise LexError('Unexpected text after amount', self.state)
 
         self.state.add_tokens(comment_tokens)
 
@@ -385,6 +444,9 @@ class LedgerLexer:
                                           self.state.lineno,
                                           pos))
 
+    def skip_comment(self):
+        self.state.directive = 'comment'
+
     def option_directive(self):
         self.state.directive = 'option'
         try:
@@ -423,6 +485,95 @@ class LedgerLexer:
             self.state.add_token(LexToken('ARGUMENT', argument,
                                           self.state.lineno, pos))
 
+    def year_directive(self):
+        self.state.directive = 'year'
+        if self.state.line.startswith('year'):
+            start = 4
+        elif self.state.line[0] == 'Y':
+            start = 1
+        else:
+            raise LexError('Unknown directive', self.state)
+        self.state.lexpos = start
+        pos = self.state.next_word_pos(skip=False)
+        if pos == -1:
+            raise LexError('Missing year', self.state)
+        self.state.lexpos = pos
+        year = self.state.line[pos:]
+        if not year.isdecimal():
+            raise LexError('Invalid year', self.state)
+        self.state.add_token(LexToken('YEAR', int(year),
+                                      self.state.lineno, pos))
+
+    def auto_xact_directive(self):
+        # The postings of an automated transaction are lexed like those of
+        # a regular one.
+        self.state.directive = 'xact'
+        self.state.lexpos = 1
+        note_pos = self.state.next_char_pos(';', hard_sep=True)
+        if note_pos > -1:
+            self.state.line = self.state.line[:note_pos].rstrip()
+            self.state.linelen = len(self.state.line)
+        pos = self.state.next_word_pos(skip=False)
+        if pos == -1:
+            raise LexError('Missing account pattern in automated transaction',
+                           self.state)
+        self.state.lexpos = pos
+        patterns = self.scan_patterns()
+        self.state.add_token(LexToken('AUTOXACT', patterns,
+                                      self.state.lineno, pos))
+
+    def periodic_xact_directive(self):
+        # The period expression is parsed with the year directives in
+        # effect, the postings are lexed like those of a regular
+        # transaction.
+        self.state.directive = 'xact'
+        self.state.lexpos = 1
+        note_pos = self.state.next_char_pos(';', hard_sep=True)
+        if note_pos > -1:
+            self.state.line = self.state.line[:note_pos].rstrip()
+            self.state.linelen = len(self.state.line)
+        pos = self.state.next_word_pos(skip=False)
+        if pos == -1:
+            raise LexError('Missing period in periodic transaction',
+                           self.state)
+        self.state.lexpos = pos
+        self.state.add_token(LexToken('PERIODIC',
+                                      self.state.line[pos:].strip(),
+                                      self.state.lineno, pos))
+
+    def scan_patterns(self):
+        # Patterns are regular expressions written as /regex/, or bare
+        # words, separated by whitespace.
+        patterns = []
+        line = self.state.line
+        pos = self.state.lexpos
+        while pos < self.state.linelen:
+            if line[pos].isspace():
+                pos += 1
+                continue
+            self.state.lexpos = pos
+            if line[pos] == '/':
+                end = pos + 1
+                while end < self.state.linelen and line[end] != '/':
+                    if line[end] == '\\':
+                        end += 1
+                    end += 1
+                if end >= self.state.linelen:
+                    raise LexError("Missing closing '/' in account pattern",
+                                   self.state)
+                pattern = line[pos+1:end].replace('\\/', '/')
+                end += 1
+            else:
+                end = self.state.next_whitespace_pos(pos)
+                if end == -1:
+                    end = self.state.linelen
+                pattern = line[pos:end]
+            if not pattern:
+                raise LexError('Empty account pattern', self.state)
+            patterns.append(pattern)
+            pos = end
+        return patterns
+
     def xact_directive(self):
         def next_word_and_check():
             word = self.state.next_word()
@@ -515,6 +666,36 @@ class LedgerLexer:
                 self.state.lexpos = pos
                 tokens.append(LexToken('TEXT', text,
                                        self.state.lineno, self.state.lexpos))
+                tokens.extend(self.tokenize_note_tags(text, pos))
+        return tokens
+
+    def tokenize_note_tags(self, text, start):
+        # Tags are written as :tag1:tag2: and metadata as 'Key: value',
+        # where the value runs until the end of the note.
+        tokens = []
+        pos = 0
+        length = len(text)
+        while pos < length:
+            while pos < length and text[pos].isspace():
+                pos += 1
+            end = pos
+            while end < length and not text[end].isspace():
+                end += 1
+            word = text[pos:end]
+            if len(word) > 2 and word[0] == ':' and word[-1] == ':':
+                for tag in word[1:-1].split(':'):
+                    if tag:
+                        tokens.append(LexToken('TAG', (sys.intern(tag), None),
+                                               self.state.lineno,
+                                               start + pos))
+            elif len(word) > 1 and word[-1] == ':' and ':' not in word[:-1]:
+                value = text[end:].strip()
+                if value:
+                    tokens.append(LexToken('TAG', (sys.intern(word[:-1]),
+                                                   value),
+                                           self.state.lineno, start + pos))
+                    break
+            pos = end
         return tokens
 
     def tokenize_xact_expression(self, text):
@@ -663,7 +844,7 @@ class LedgerLexer:
         except IndexError:
             pass
         else:
-            check_unexpected_character(char.isspace(), char)
+            check_unexpected_character(not char.isspace(), char)
 
         if not number_done:
             raise LexError('No quantity specified for amount', self.state)
@@ -686,7 +867,104 @@ class LedgerLexer:
                                    self.state.lineno, symbol_pos))
         return tokens
 
+    def tokenize_balance(self):
+        # A balance assertion, or an assignment when the posting has no
+        # amount, written as '= AMOUNT' after the amount.
+        tokens = [LexToken('BALANCE', '=',
+                           self.state.lineno, self.state.lexpos)]
+        self.state.lexpos += 1
+        pos = self.state.next_word_pos(skip=False)
+        if pos == -1:
+            raise LexError('Missing amount in balance assertion', self.state)
+        self.state.lexpos = pos
+        tokens.extend(self.tokenize_amount())
+        return tokens
+
+    def tokenize_enclosed_amount(self, end):
+        # Tokenizes the amount between lexpos and end, which must hold
+        # nothing else.
+        line = self.state.line
+        linelen = self.state.linelen
+        self.state.line = line[:end].rstrip()
+        self.state.linelen = len(self.state.line)
+        try:
+            pos = self.state.next_word_pos(skip=False)
+            if pos == -1:
+                raise LexError('Missing amount', self.state)
+            self.state.lexpos = pos
+            tokens = self.tokenize_amount()
+            if self.state.lexpos < self.state.linelen:
+                raise LexError('Unexpected text after amount', self.state)
+        finally:
+            self.state.line = line
+            self.state.linelen = linelen
+        return tokens
+
+    def tokenize_lot_cost(self):
+        # The cost of a lot, per unit as {AMOUNT} or in total as
+        # {{AMOUNT}}.
+        start = self.state.lexpos
+        total = self.state.line.startswith('{{', start)
+        close = '}}' if total else '}'
+        end = self.state.line.find(close, start)
+        if end == -1:
+            raise LexError("Missing closing '{}' in lot cost".format(close),
+                           self.state)
+        tokens = [LexToken('COST', total, self.state.lineno, start)]
+        self.state.lexpos = start + len(close)
+        tokens.extend(self.tokenize_enclosed_amount(end))
+        self.state.lexpos = end + len(close)
+        return tokens
+
+    def tokenize_lot_date(self):
+        # The date a lot was acquired, as [DATE].
+        start = self.state.lexpos
+        end = self.state.line.find(']', start)
+        if end == -1:
+            raise LexError("Missing closing ']' in lot date", self.state)
+        self.state.lexpos += 1
+        date = self.scan_date(self.state.line[start+1:end].strip())
+        self.state.lexpos = end + 1
+        return [LexToken('LOTDATE', date, self.state.lineno, start + 1)]
+
+    def tokenize_price(self):
+        # The price of the amount, per unit as @ AMOUNT or in total as
+        # @@ AMOUNT.
+        start = self.state.lexpos
+        total = self.state.line.startswith('@@', start)
+        tokens = [LexToken('PRICE', total, self.state.lineno, start)]
+        self.state.lexpos = start + (2 if total else 1)
+        pos = self.state.next_word_pos(skip=False)
+        if pos == -1:
+            raise LexError('Missing amount in price', self.state)
+        self.state.lexpos = pos
+        tokens.extend(self.tokenize_amount())
+        return tokens
+
     def tokenize_amount_expression(self):
+        # Scans a parenthesized value expression up to its matching closing
+        # parenthesis, which may be followed by a note only.
         tokens = []
-        # TODO
+        start = self.state.lexpos
+        depth = 0
+        quote = None
+        for pos in range(start, self.state.linelen):
+            char = self.state.line[pos]
+            if quote is not None:
+                if char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+        else:
+            raise LexError("Missing closing ')' in amount expression",
+                           self.state)
+        tokens.append(LexToken('VALEXPR', self.state.line[start:pos+1],
+                               self.state.lineno, start))
+        self.state.lexpos = pos + 1
         return tokens
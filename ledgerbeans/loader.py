@@ -0,0 +1,229 @@
+import gc
+import heapq
+import logging
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from operator import attrgetter
+
+from ledgerbeans import ast
+from ledgerbeans.assertions import (BalanceChecker, BalanceError,
+                                    assign_balances)
+from ledgerbeans.automated import automate, automate_journal
+from ledgerbeans.lexer import LedgerLexer, LexError
+from ledgerbeans.parser import LedgerParser, ParseError, default_pool
+from ledgerbeans.tags import TagIndex
+from ledgerbeans.valexpr import ExpressionError, failed_expressions
+
+
+logger = logging.getLogger(__name__)
+
+
+date_key = attrgetter('ordinal')
+
+
+class LoadError(Exception):
+    def __init__(self, filename, lineno, lexpos, message):
+        super().__init__(filename, lineno, lexpos, message)
+        self.filename = filename
+        self.lineno = lineno
+        self.lexpos = lexpos
+        self.message = message
+
+    def __str__(self):
+        return '{0.filename}:{0.lineno}:{0.lexpos}:{0.message}'.format(self)
+
+
+@contextmanager
+def gc_disabled():
+    # The AST holds no reference cycles, so there is nothing for the cyclic
+    # collector to find while loading, only objects to walk over again and
+    # again. It is only paused when no other thread runs, as in a command
+    # loading its files, since the threads of the server or of a program
+    # using the api may create cycles meanwhile. Other threads can then only
+    # be started by this one, until the collector runs again.
+    if threading.active_count() > 1 or not gc.isenabled():
+        yield
+        return
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+
+def check_expressions(journal, filename):
+    # Failed assert expressions stop loading, failed checks are logged.
+    for xact in journal.transactions():
+        try:
+            for expression in failed_expressions(xact):
+                message = '{} failed: {}'.format(expression.kind.capitalize(),
+                                                 expression.text)
+                if expression.generated:
+                    message += ', for the transaction on line {}'.format(
+                        xact.lineno)
+                error = LoadError(filename, expression.lineno, 1, message)
+                if expression.kind == 'assert':
+                    raise error
+                logger.warning(str(error))
+        except ExpressionError as e:
+            raise LoadError(filename, e.lineno, 1, e.message)
+
+
+@contextmanager
+def load_errors(filename):
+    # Raises the errors of lexing and parsing as LoadError.
+    try:
+        yield
+    except LexError as e:
+        raise LoadError(filename, e.state.lineno, e.state.lexpos + 1,
+                        e.message)
+    except SyntaxError as e:
+        raise LoadError(filename, e.lineno, e.offset, e.msg)
+    except ParseError as e:
+        raise LoadError(filename, e.lineno, e.lexpos, e.message)
+    except OSError as e:
+        raise LoadError(filename, 0, 0, str(e))
+
+
+def parsing(debug=False, pool=None):
+    # Parsers come from pool, or from the default pool, so loading many
+    # small documents does not set up the grammar for each of them.
+    if debug:
+        return nullcontext(LedgerParser(errorlog=logger, debug=logger))
+    if pool is None:
+        pool = default_pool()
+    return pool.parser()
+
+
+def load(f, debug=False, pool=None, trivia=True):
+    # Without trivia the journal has no comments and empty lines, see
+    # LedgerLexer.
+    start = time.perf_counter()
+    lexer = LedgerLexer(f, trivia)
+    with parsing(debug, pool) as parser, gc_disabled():
+        with load_errors(f.name):
+            journal = parser.parse(lexer)
+        journal.assertions = parser.assertions
+        automate_journal(journal)
+        check_expressions(journal, f.name)
+        journal.tag_index = TagIndex(journal.transactions())
+    logger.info('Loaded {} in {:.3f}s'.format(f.name,
+                                              time.perf_counter() - start))
+    return journal
+
+
+def load_items(f, debug=False, pool=None, trivia=True):
+    # Yields the items of f as they are parsed, one entry at a time, without
+    # keeping them in a journal. Automated transactions are not applied and
+    # nothing is checked, the items are as written.
+    lexer = LedgerLexer(f, trivia)
+    with parsing(debug, pool) as parser, load_errors(f.name):
+        yield from parser.items(lexer)
+
+
+def load_file(filename, debug=False, trivia=True):
+    with open(filename) as f:
+        return load(f, debug=debug, trivia=trivia)
+
+
+def stream_file(f, debug=False, trivia=True):
+    # Yields the transactions of f as they are parsed, with the automated
+    # transactions before them applied, so only the transactions the caller
+    # holds on to are in memory.
+    for item in automate(load_items(f, debug=debug, trivia=trivia)):
+        if isinstance(item, ast.Transaction):
+            yield item
+
+
+def stream_all(files, debug=False, trivia=True):
+    # Merges the transactions of the files in date order as they are
+    # parsed, see stream_transactions(), and gives balance assignments
+    # their amounts on the way. Balance assertions and assert expressions
+    # are not checked, that takes the whole journal, see load_all().
+    from ledgerbeans.snapshot import is_snapshot
+
+    for f in files:
+        if is_snapshot(f.name):
+            raise LoadError(f.name, 0, 0, 'Snapshots can only be read by '
+                            'the balance and register commands')
+    streams = [stream_file(f, debug=debug, trivia=trivia) for f in files]
+    return assign_balances(heapq.merge(*streams, key=date_key))
+
+
+def check_balances(journals, openings=None, checker=None):
+    # Verifies the balance assertions of the journals together, in date
+    # order, and assigns the amounts of balance assignments.
+    if not any(journal.assertions for journal in journals):
+        return checker
+    if checker is None:
+        checker = BalanceChecker(openings)
+    start = time.perf_counter()
+    try:
+        with gc_disabled():
+            verified = checker.check(merge_transactions(journals))
+    except BalanceError as e:
+        raise LoadError(e.filename, e.lineno, 1, e.message)
+    logger.info('Verified {} balance assertions in {:.3f}s'.format(
+        verified, time.perf_counter() - start))
+    return checker
+
+
+def load_all(files, debug=False, jobs=None, begin=None, end=None,
+             openings=None, trivia=True):
+    # Files are parsed in worker processes, since lexing and parsing are
+    # bound by the interpreter. Streams without a name on disk, such as
+    # standard input, are parsed here. Shard manifests are expanded to the
+    # shards overlapping [begin, end), see shard.load_manifest(), whose
+    # opening balances start the balance assertion checks.
+    from ledgerbeans.shard import is_manifest, load_manifest
+    from ledgerbeans.snapshot import is_snapshot
+
+    for f in files:
+        if is_snapshot(f.name):
+            raise LoadError(f.name, 0, 0, 'Snapshots can only be read by '
+                            'the balance and register commands')
+    if len(files) == 1 and not is_manifest(files[0].name):
+        journals = [load(files[0], debug=debug, trivia=trivia)]
+        check_balances(journals)
+        return journals
+    balances = {}
+    journals = [None] * len(files)
+    futures = {}
+    # The collector is paused before the pool starts its threads.
+    with gc_disabled(), ProcessPoolExecutor(max_workers=jobs) as pool:
+        for i, f in enumerate(files):
+            if f.name.startswith('<'):
+                journals[i] = [load(f, debug=debug, trivia=trivia)]
+            elif is_manifest(f.name):
+                f.close()
+                journals[i] = load_manifest(f.name, debug=debug, jobs=jobs,
+                                            begin=begin, end=end,
+                                            openings=openings,
+                                            balances=balances)
+            else:
+                f.close()
+                futures[i] = pool.submit(load_file, f.name, debug, trivia)
+        for i, future in futures.items():
+            journals[i] = [future.result()]
+    journals = [journal for loaded in journals for journal in loaded]
+    check_balances(journals, balances)
+    return journals
+
+
+def sorted_transactions(journal):
+    # Stable, so transactions on the same date keep their file order.
+    return sorted(journal.transactions(), key=date_key)
+
+
+def merge_transactions(journals):
+    return heapq.merge(*[sorted_transactions(j) for j in journals],
+                       key=date_key)
+
+
+def stream_transactions(journals):
+    # Merges the journals in file order without sorting them first, so the
+    # result is only in date order when the files are.
+    return heapq.merge(*[j.transactions() for j in journals], key=date_key)
@@ -0,0 +1,191 @@
+import logging
+
+from collections import deque
+
+from ledgerbeans import ast
+from ledgerbeans.date import from_ordinal
+from ledgerbeans.report import (Query, Totals, format_amount, symbol_of,
+                                truncate)
+
+
+logger = logging.getLogger(__name__)
+
+
+methods = ['fifo', 'lifo']
+
+
+class LotError(Exception):
+    def __init__(self, filename, lineno, message):
+        super().__init__(filename, lineno, message)
+        self.filename = filename
+        self.lineno = lineno
+        self.message = message
+
+
+class OpenLot:
+    # The part of a purchase that is not sold yet.
+    __slots__ = ('quantity', 'cost', 'commodity', 'ordinal')
+
+    def __init__(self, quantity, cost, commodity, ordinal):
+        self.quantity = quantity
+        self.cost = cost
+        self.commodity = commodity
+        self.ordinal = ordinal
+
+
+class Inventory:
+    # The open lots of one commodity in one account, in the order they
+    # were bought. Specific lots are found through queues per cost, per
+    # date and per both, which hold the same lots. A sale only removes the
+    # lots it empties from the queue it takes them from, the other queues
+    # drop them when they reach them, so every lot is removed from every
+    # queue at most once and a sale costs O(1) per lot it consumes.
+    def __init__(self):
+        self.lots = deque()
+        self.specific = {}
+
+    def add(self, lot):
+        self.lots.append(lot)
+        symbol = symbol_of(lot.commodity)
+        for key in [(lot.cost, symbol, None), (None, None, lot.ordinal),
+                    (lot.cost, symbol, lot.ordinal)]:
+            self.specific.setdefault(key, deque()).append(lot)
+
+    def take(self, quantity, method='fifo', key=None):
+        # Yields (lot, quantity taken from it) until quantity is taken or
+        # no lot is left, from the lots matching key, or else in method
+        # order.
+        if key is not None:
+            lots = self.specific.get(key, ())
+            last = False
+        else:
+            lots = self.lots
+            last = method == 'lifo'
+        while quantity and lots:
+            lot = lots[-1] if last else lots[0]
+            if lot.quantity:
+                taken = min(lot.quantity, quantity)
+                lot.quantity -= taken
+                quantity -= taken
+                yield lot, taken
+            if not lot.quantity:
+                if last:
+                    lots.pop()
+                else:
+                    lots.popleft()
+
+
+class Sale:
+    # The part of a sale matched with one lot. Proceeds and gain are None
+    # when the sale has no price in the commodity the lot was bought for.
+    def __init__(self, xact, post, lot, quantity, price):
+        self.xact = xact
+        self.post = post
+        self.lot = lot
+        self.quantity = quantity
+        self.basis = quantity * lot.cost
+        if price is None or \
+           symbol_of(price[1]) != symbol_of(lot.commodity):
+            self.proceeds = None
+            self.gain = None
+        else:
+            self.proceeds = quantity * price[0]
+            self.gain = self.proceeds - self.basis
+
+
+def unit_price(quantity, annotation, amount):
+    # The price of one unit as (quantity, commodity).
+    if annotation.total:
+        return abs(amount.amount / quantity), amount.symbol
+    return amount.amount, amount.symbol
+
+
+def lot_key(post):
+    # The key of Inventory.specific selecting the lots a sale names.
+    lot = post.lot
+    if lot is None:
+        return None
+    if lot.cost is not None:
+        cost, commodity = unit_price(post.amount.amount, lot, lot.cost)
+        return (cost, symbol_of(commodity), lot.ordinal)
+    if lot.ordinal is not None:
+        return (None, None, lot.ordinal)
+    return None
+
+
+def match_lots(transactions, method='fifo'):
+    # Yields a Sale for every part of a sale matched with a lot, taking the
+    # transactions in date order. Postings with a lot or a price buy a lot
+    # when their quantity is positive and sell from the lots of their
+    # account and commodity when it is negative.
+    inventories = {}
+    for xact in transactions:
+        for post in xact:
+            if not isinstance(post, ast.Posting) or post.amount is None or \
+               (post.lot is None and post.price is None):
+                continue
+            quantity = post.amount.amount
+            key = (post.account.name, symbol_of(post.amount.symbol))
+            inventory = inventories.get(key)
+            if inventory is None:
+                inventory = inventories[key] = Inventory()
+            price = None
+            if post.price is not None:
+                price = unit_price(quantity, post.price, post.price.amount)
+            if quantity > 0:
+                if post.lot is not None and post.lot.cost is not None:
+                    cost = unit_price(quantity, post.lot, post.lot.cost)
+                elif price is not None:
+                    cost = price
+                else:
+                    continue
+                inventory.add(OpenLot(quantity, cost[0], cost[1],
+                                      (post.lot and post.lot.ordinal) or
+                                      xact.ordinal))
+            elif quantity < 0:
+                left = -quantity
+                specific = lot_key(post)
+                for lot, taken in inventory.take(left, method, specific):
+                    left -= taken
+                    yield Sale(xact, post, lot, taken, price)
+                if not left:
+                    continue
+                message = 'No lot left to sell {} from in {}'.format(
+                    format_amount(left, post.amount.symbol),
+                    post.account.name)
+                if specific is not None:
+                    raise LotError(xact.source, post.lineno or xact.lineno,
+                                   message)
+                # Such as currency bought without a price, it has no
+                # cost to realize a gain against.
+                logger.warning('{}:{}:{}'.format(
+                    xact.source, post.lineno or xact.lineno, message))
+
+
+def gains_report(transactions, query=None, method='fifo', begin=None,
+                 end=None):
+    # Lots bought before begin count, only sales in [begin, end) are shown.
+    if query is None:
+        query = Query()
+    totals = Totals()
+    for sale in match_lots(transactions, method):
+        ordinal = sale.xact.ordinal
+        if begin is not None and ordinal < begin or \
+           end is not None and ordinal >= end or not query(sale.post):
+            continue
+        commodity = sale.lot.commodity
+        if sale.gain is None:
+            proceeds = gain = '-'
+        else:
+            proceeds = format_amount(sale.proceeds, commodity)
+            gain = format_amount(sale.gain, commodity)
+            totals.add(sale.gain, commodity)
+        yield '{} {:30} {:>14} {} {:>14} {:>14} {:>14}'.format(
+            sale.xact.date, truncate(sale.post.account.name, 30),
+            format_amount(sale.quantity, sale.post.amount.symbol),
+            from_ordinal(sale.lot.ordinal),
+            format_amount(sale.basis, commodity), proceeds, gain)
+    yield '-' * 14
+    for amount in totals.lines():
+        yield '{:>14}'.format(amount)
+
@@ -1,11 +1,9 @@
 import argparse
+import importlib
 import logging
-import reg
 import sys
 
-from ledgerbeans import version
-from ledgerbeans.command.lex import command_lex
-from ledgerbeans.command.ast import command_ast
+from ledgerbeans.date import parse_date
 
 
 log_levels = {
@@ -18,29 +16,247 @@ log_levels = {
 logger = logging.getLogger()
 
 
+def argument(*args, **kw):
+    return args, kw
+
+
+periods = ['daily', 'weekly', 'monthly', 'quarterly', 'yearly']
+
+shard_periods = ['monthly', 'quarterly', 'yearly']
+
+patterns_argument = argument('patterns', metavar='PATTERN', nargs='*',
+                             help="only report accounts matching PATTERN, "
+                             "postings tagged KEY with tag:KEY[=VALUE], or "
+                             "transactions whose description or notes "
+                             "contain TEXT with payee:TEXT or note:TEXT")
+
+no_trivia_argument = argument('--no-trivia', dest='trivia', default=True,
+                              action='store_false',
+                              help="skip comments and empty lines while "
+                              "lexing instead of keeping them")
+
+
+class Command:
+    # Command modules are only imported when their command is run, so
+    # starting a command does not pay for the dependencies of the others.
+    def __init__(self, name, description, help, arguments=(), parents=(),
+                 module=None):
+        self.name = name
+        self.module = module or name
+        self.description = description
+        self.help = help
+        self.arguments = arguments
+        self.parents = parents
+
+    def add_parser(self, subparsers, parents):
+        parser = subparsers.add_parser(self.name,
+                                       parents=[parents[p]
+                                                for p in self.parents],
+                                       description=self.description,
+                                       help=self.help)
+        for args, kw in self.arguments:
+            parser.add_argument(*args, **kw)
+        parser.set_defaults(cmd_func=self)
+        return parser
+
+    def __call__(self, args):
+        module = importlib.import_module('ledgerbeans.command.' +
+                                         self.module)
+        func = getattr(module, 'command_' + self.name)
+        return func(args)
+
+
+commands = [
+    Command('lex',
+            description="Show tokens after lexing and exit",
+            help="show tokens after lexing and exit",
+            arguments=[no_trivia_argument],
+            parents=['main']),
+    Command('ast',
+            description="Show abstract syntax tree after parsing and exit",
+            help="show AST after parsing and exit",
+            arguments=[no_trivia_argument],
+            parents=['main']),
+    Command('print',
+            description="Write the ledger files back in a uniform layout, "
+            "reading and writing one transaction at a time",
+            help="reformat ledger files",
+            arguments=[
+                argument('--amount-column', metavar='N', type=int,
+                         default=48,
+                         help="right align the amounts of postings on "
+                         "column N; default is %(default)s"),
+            ],
+            parents=['main']),
+    Command('balance',
+            description="Show account balances",
+            help="show account balances",
+            arguments=[
+                argument('--checkpoints', default=False,
+                         action='store_true',
+                         help="save the balances at the start of every "
+                         "month next to each ledger file, and start from "
+                         "the last one before --end; an edit only sums the "
+                         "months from the edited one on again"),
+                patterns_argument,
+            ],
+            parents=['main', 'report']),
+    Command('register',
+            description="Show postings with a running total",
+            help="show postings with a running total",
+            arguments=[patterns_argument],
+            parents=['main', 'report']),
+    Command('rollup',
+            description="Show account totals per period, reading "
+            "transactions in date order and reporting every period as "
+            "soon as it is complete",
+            help="show account totals per period",
+            arguments=[
+                argument('-p', '--period', choices=periods,
+                         default='monthly',
+                         help="one of %(choices)s; default is %(default)s"),
+                argument('--reorder-window', metavar='DAYS', type=int,
+                         default=7,
+                         help="accept transactions up to DAYS days out of "
+                         "date order; default is %(default)s"),
+                argument('--buffer-size', metavar='N', type=int,
+                         default=100000,
+                         help="keep at most N postings waiting for "
+                         "reordering in memory, spilling the rest to "
+                         "temporary files; default is %(default)s"),
+                patterns_argument,
+            ],
+            parents=['main', 'report']),
+    Command('stats',
+            description="Show statistics of the ledger files, reading one "
+            "transaction at a time; the number of payees is estimated",
+            help="show statistics of the ledger files",
+            parents=['main']),
+    Command('gains',
+            description="Show the realized gains of sales, matching them "
+            "with the lots bought before them; postings with a lot {COST} "
+            "or a price @ PRICE buy a lot when their amount is positive and "
+            "sell when it is negative",
+            help="show realized gains",
+            arguments=[
+                argument('-m', '--method', choices=['fifo', 'lifo'],
+                         default='fifo',
+                         help="sell lots first in, first out or last in, "
+                         "first out when a sale names no lot; default is "
+                         "%(default)s"),
+                patterns_argument,
+            ],
+            parents=['main', 'report']),
+    Command('import',
+            module='csvimport',
+            description="Convert bank CSV rows to transactions using a "
+            "rules file, skipping rows that are already in the ledger "
+            "files",
+            help="import transactions from a CSV file",
+            arguments=[
+                argument('csv', metavar='CSV',
+                         help="read rows from the CSV file CSV"),
+                argument('-r', '--rules', metavar='RULES',
+                         help="map columns using RULES; default is "
+                         "CSV.rules"),
+                argument('--date-window', metavar='DAYS', type=int,
+                         default=3,
+                         help="treat a row as a duplicate of a transaction "
+                         "up to DAYS days apart; default is %(default)s"),
+                argument('--append', default=False, action='store_true',
+                         help="append new transactions to the first "
+                         "ledger file instead of writing them to the "
+                         "output"),
+            ],
+            parents=['main']),
+    Command('shard',
+            description="Split the ledger file into one file per period "
+            "and write a manifest of them; use the manifest with -f to load "
+            "only the files a report needs",
+            help="split a ledger file into shards",
+            arguments=[
+                argument('manifest', metavar='MANIFEST',
+                         help="write the manifest to MANIFEST, a .json "
+                         "file, and the shards next to it"),
+                argument('-p', '--period', choices=shard_periods,
+                         default='monthly',
+                         help="one of %(choices)s; default is %(default)s"),
+            ],
+            parents=['main']),
+    Command('snapshot',
+            description="Write the postings of the ledger files to a "
+            "snapshot of fixed width columns; balance and register read a "
+            "snapshot given with -f without parsing, as long as the ledger "
+            "files did not change",
+            help="write a snapshot of the ledger files",
+            arguments=[
+                argument('snapshot', metavar='SNAPSHOT',
+                         help="write the snapshot to SNAPSHOT, a .snapshot "
+                         "file"),
+            ],
+            parents=['main']),
+    Command('sort',
+            description="Write the ledger file with its transactions in "
+            "date order, keeping the text of every transaction and the "
+            "comments before it as they are; transactions are not moved "
+            "across directives",
+            help="sort the transactions of a ledger file by date",
+            arguments=[
+                argument('--buffer-size', metavar='MB', type=int,
+                         default=64,
+                         help="keep at most MB megabytes of transactions "
+                         "in memory, sorting the rest in temporary files; "
+                         "default is %(default)s"),
+            ],
+            parents=['main']),
+    Command('serve',
+            description="Load the ledger file once and answer queries over "
+            "a Unix domain socket, reloading when the file changes",
+            help="answer queries from a loaded ledger file",
+            arguments=[
+                argument('--interval', metavar='SECONDS', type=float,
+                         default=1.0,
+                         help="check the ledger file for changes every "
+                         "SECONDS; default is %(default)s"),
+            ],
+            parents=['main', 'socket']),
+    Command('client',
+            description="Send a query to a running server and show the "
+            "result",
+            help="query a running server",
+            arguments=[
+                argument('query', metavar='QUERY', nargs=argparse.REMAINDER,
+                         help="one of ast, balance or register, followed "
+                         "by -b DATE, -e DATE and account patterns"),
+            ],
+            parents=['main', 'socket']),
+]
+
+
+class VersionAction(argparse.Action):
+    def __init__(self, option_strings, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings=option_strings, dest=dest,
+                         default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        # Looking up the version is slow, only do it when asked for.
+        from ledgerbeans import version
+        parser.exit(message='{} {}\n'.format(parser.prog, version))
+
+
 def configure_logging(args):
     logger.setLevel(log_levels[args.log_level])
     console_log = logging.StreamHandler(stream=sys.stderr)
     logger.addHandler(console_log)
 
 
-def register(registry=None):
-    if registry is None:
-        registry = reg.Registry()
-    from ledgerbeans.printer import register as register_printer
-    register_printer(registry)
-    reg.implicit.initialize(registry)
-
-
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
-    register()
-
     main_arg = argparse.ArgumentParser(add_help=False)
-    main_arg.add_argument('--version', action='version',
-                          version='%(prog)s {}'.format(version),
+    main_arg.add_argument('--version', action=VersionAction,
                           help="print version information and exit")
     main_arg.add_argument('--debug', default=False,
                           action='store_true',
@@ -49,16 +265,48 @@ def main(argv=None):
                           choices=log_levels.keys(), default='warning',
                           help="set logging to LEVEL, where LEVEL is "
                           "one of %(choices)s; default is %(default)s")
-    main_arg.add_argument('-f', '--file', metavar='FILE',
+    main_arg.add_argument('-f', '--file', metavar='FILE', dest='files',
                           type=argparse.FileType('r'),
-                          default=sys.stdin,
-                          help="read FILE as a ledger file")
+                          action='append',
+                          help="read FILE as a ledger file, may be given "
+                          "more than once; default is standard input")
+    main_arg.add_argument('-j', '--jobs', metavar='N', type=int,
+                          help="parse up to N ledger files at the same "
+                          "time; default is the number of processors")
     main_arg.add_argument('-o', '--output', metavar='FILE',
                           type=argparse.FileType('w'),
                           default=sys.stdout,
                           help="redirect output to FILE")
 
-    # file_arg = argparse.ArgumentParser(add_help=False)
+    socket_arg = argparse.ArgumentParser(add_help=False)
+    socket_arg.add_argument('--socket', metavar='PATH',
+                            help="use the Unix domain socket at PATH; "
+                            "default is $LEDGERBEANS_SOCKET or "
+                            "ledgerbeans-UID.sock in $XDG_RUNTIME_DIR")
+
+    report_arg = argparse.ArgumentParser(add_help=False)
+    report_arg.add_argument('-b', '--begin', metavar='DATE', type=parse_date,
+                            help="only report postings on or after DATE")
+    report_arg.add_argument('-e', '--end', metavar='DATE', type=parse_date,
+                            help="only report postings before DATE")
+    report_arg.add_argument('--keep-index', default=False,
+                            action='store_true',
+                            help="save the index used by payee: and note: "
+                            "next to each ledger file, and reuse it while "
+                            "the file is unchanged")
+    args, kw = no_trivia_argument
+    report_arg.add_argument(*args, **kw)
+    report_arg.add_argument('--forecast', default=False,
+                            action='store_true',
+                            help="add the occurrences of periodic "
+                            "transactions from DATE of --begin, or today, "
+                            "until DATE of --end, or five years later")
+
+    parents = {
+        'main': main_arg,
+        'report': report_arg,
+        'socket': socket_arg,
+    }
 
     parser = argparse.ArgumentParser(parents=[main_arg],
                                      description="Double-entry "
@@ -69,24 +317,16 @@ def main(argv=None):
     subparsers = parser.add_subparsers(title='available commands',
                                        dest='command',
                                        metavar='<command>')
-
-    lex_parser = subparsers.add_parser('lex', parents=[main_arg],
-                                       description="Show tokens after lexing "
-                                       "and exit",
-                                       help="show tokens after lexing "
-                                       "and exit")
-    lex_parser.set_defaults(cmd_func=command_lex)
-
-    ast_parser = subparsers.add_parser('ast', parents=[main_arg],
-                                       description="Show abstract syntax tree "
-                                       "after parsing and exit",
-                                       help="show AST after parsing "
-                                       "and exit")
-    ast_parser.set_defaults(cmd_func=command_ast)
+    for command in commands:
+        command.add_parser(subparsers, parents)
 
     args = parser.parse_args(argv)
     configure_logging(args)
-    print(args.command)
+    if args.files is None:
+        args.files = [sys.stdin]
+    if args.command is None:
+        parser.print_help()
+        return
     args.cmd_func(args)
 
 
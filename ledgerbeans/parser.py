@@ -1,15 +1,49 @@
 import logging
+import queue
+import re
+import threading
 import ply.yacc as yacc
 
+from contextlib import contextmanager
+
 from ledgerbeans import ast
+from ledgerbeans.automated import compile_patterns
+from ledgerbeans.balancing import UnbalancedError, balance_transaction
+from ledgerbeans.date import to_ordinal
+from ledgerbeans.lexer import LedgerLexer, LexToken
+from ledgerbeans.period import parse_interval
+from ledgerbeans.valexpr import (ExpressionError, compile_expression,
+                                 evaluate_amount)
 
 
 logger = logging.getLogger(__name__)
 
 
+class ParseError(Exception):
+    # Raised from grammar rules, where ply would take a SyntaxError as a
+    # request for error recovery.
+    def __init__(self, message, lineno, lexpos):
+        super().__init__(message, lineno, lexpos)
+        self.message = message
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+
+class TokenBatch:
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+
+    def token(self):
+        return next(self.tokens, None)
+
+
 class LedgerParser:
     def p_journal1(self, p):
         '''journal : items EOF'''
+        for item in p[1]:
+            if isinstance(item, (ast.Transaction,
+                                 ast.PeriodicTransaction)):
+                item.source = p[2]
         p[0] = ast.Journal(name=p[2], children=p[1])
 
     def p_items1(self, p):
@@ -23,7 +57,10 @@ class LedgerParser:
 
     def p_item1(self, p):
         '''item : xact_directive
-                | comment_directive'''
+                | auto_xact_directive
+                | periodic_xact_directive
+                | comment_directive
+                | year_directive'''
         p[0] = p[1]
 
     def p_item2(self, p):
@@ -32,17 +69,63 @@ class LedgerParser:
 
     def p_comment_directive(self, p):
         '''comment_directive : COMMENT TEXT'''
-        p[0] = ast.Comment(p[2])
+        p[0] = ast.Comment(p[2], char=p[1])
+
+    def p_year_directive(self, p):
+        '''year_directive : YEAR'''
+        self.year = p[1]
+        p[0] = ast.Year(p[1])
 
     def p_xact_directive(self, p):
         '''xact_directive : DATE auxdate_opt status_opt code_opt DESCRIPTION note_opt xact_postings'''
-        p[0] = ast.Transaction(date=p[1],
-                               auxdate=p[2],
-                               status=p[3],
-                               code=p[4],
-                               description=p[5],
-                               note=p[6],
-                               children=p[7])
+        try:
+            p[0] = ast.Transaction(date=p[1],
+                                   auxdate=p[2],
+                                   status=p[3],
+                                   code=p[4],
+                                   description=p[5],
+                                   note=p[6],
+                                   children=p[7],
+                                   lineno=p.lineno(1),
+                                   year=self.year)
+        except ValueError as e:
+            # Such as 2/29 after a year directive for a year without it.
+            raise ParseError('Invalid date: {}'.format(e), p.lineno(1),
+                             p.lexpos(1) + 1)
+        try:
+            balance_transaction(p[0])
+        except UnbalancedError as e:
+            raise ParseError(e.message, e.lineno, 1)
+
+    def p_auto_xact_directive(self, p):
+        '''auto_xact_directive : AUTOXACT xact_postings'''
+        for post in p[2]:
+            if isinstance(post, ast.Posting) and post.amount is None:
+                raise ParseError('Missing amount in automated transaction',
+                                 p.lineno(1), 1)
+        try:
+            compile_patterns(p[1])
+        except re.error as e:
+            raise ParseError('Invalid account pattern: {}'.format(e),
+                             p.lineno(1), p.lexpos(1) + 1)
+        p[0] = ast.AutomatedTransaction(patterns=p[1],
+                                        children=p[2],
+                                        lineno=p.lineno(1))
+
+    def p_periodic_xact_directive(self, p):
+        '''periodic_xact_directive : PERIODIC xact_postings'''
+        try:
+            interval = parse_interval(p[1])
+        except ValueError as e:
+            raise ParseError(str(e), p.lineno(1), p.lexpos(1) + 1)
+        p[0] = ast.PeriodicTransaction(text=p[1],
+                                       interval=interval,
+                                       children=p[2],
+                                       lineno=p.lineno(1))
+        try:
+            balance_transaction(p[0])
+        except UnbalancedError as e:
+            raise ParseError(e.message, e.lineno, 1)
 
     def p_auxdate_opt(self, p):
         '''auxdate_opt : AUXDATE
@@ -72,8 +155,17 @@ class LedgerParser:
         p[0] = p[1]
 
     def p_note(self, p):
-        '''note : NOTE TEXT'''
-        p[0] = ast.Note(p[2])
+        '''note : NOTE TEXT tags'''
+        p[0] = ast.Note(p[2], tags=p[3])
+
+    def p_tags1(self, p):
+        '''tags : tags TAG'''
+        p[1].append(p[2])
+        p[0] = p[1]
+
+    def p_tags2(self, p):
+        '''tags : empty'''
+        p[0] = []
 
     def p_xact_postings1(self, p):
         '''xact_postings : xact_postings xact_posting'''
@@ -85,16 +177,38 @@ class LedgerParser:
         p[0] = []
 
     def p_xact_posting1(self, p):
-        '''xact_posting : INDENT status_opt account amount_opt note_opt'''
+        '''xact_posting : INDENT status_opt account amount_opt lot_opt price_opt balance_opt note_opt'''
+        if (p[5] is not None or p[6] is not None) and \
+           (p[4] is None or p[4].symbol is None):
+            raise ParseError('Lot or price without a commodity amount',
+                             p.lineno(1), 1)
         p[0] = ast.Posting(status=p[2],
                            account=p[3],
                            amount=p[4],
-                           note=p[5])
+                           lot=p[5],
+                           price=p[6],
+                           balance=p[7],
+                           note=p[8],
+                           lineno=p.lineno(1))
 
     def p_xact_posting2(self, p):
         '''xact_posting : INDENT note'''
         p[0] = p[2]
 
+    def p_xact_posting3(self, p):
+        '''xact_posting : INDENT expression note_opt'''
+        p[0] = p[2]
+
+    def p_expression(self, p):
+        '''expression : ASSERT VALEXPR
+                      | CHECK VALEXPR
+                      | EXPR VALEXPR'''
+        try:
+            compile_expression(p[2])
+        except ExpressionError as e:
+            self.expression_error(p, 2, e)
+        p[0] = ast.Expression(kind=p[1], text=p[2], lineno=p.lineno(1))
+
     def p_account1(self, p):
         '''account : ACCOUNT'''
         p[0] = ast.Account(name=p[1])
@@ -114,13 +228,60 @@ class LedgerParser:
 
     def p_amount_opt1(self, p):
         '''amount_opt : AMOUNT symbol_opt'''
-        print(p[2])
         p[0] = ast.Amount(amount=p[1], symbol=p[2])
 
+    def p_amount_opt3(self, p):
+        '''amount_opt : VALEXPR'''
+        try:
+            quantity, symbol = evaluate_amount(p[1])
+        except ExpressionError as e:
+            self.expression_error(p, 1, e)
+        p[0] = ast.Amount(amount=quantity, symbol=symbol, expression=p[1])
+
     def p_amount_opt2(self, p):
         '''amount_opt : empty'''
         p[0] = p[1]
 
+    def p_lot_opt1(self, p):
+        '''lot_opt : lot_opt COST AMOUNT symbol_opt'''
+        if p[1] is None:
+            p[1] = ast.Lot()
+        p[1].cost = ast.Amount(amount=p[3], symbol=p[4])
+        p[1].total = p[2]
+        p[0] = p[1]
+
+    def p_lot_opt2(self, p):
+        '''lot_opt : lot_opt LOTDATE'''
+        if p[1] is None:
+            p[1] = ast.Lot()
+        try:
+            p[1].ordinal = to_ordinal(p[2], self.year)
+        except ValueError as e:
+            raise ParseError('Invalid lot date: {}'.format(e), p.lineno(2),
+                             p.lexpos(2) + 1)
+        p[0] = p[1]
+
+    def p_lot_opt3(self, p):
+        '''lot_opt : empty'''
+        p[0] = p[1]
+
+    def p_price_opt1(self, p):
+        '''price_opt : PRICE AMOUNT symbol_opt'''
+        p[0] = ast.Price(ast.Amount(amount=p[2], symbol=p[3]), total=p[1])
+
+    def p_price_opt2(self, p):
+        '''price_opt : empty'''
+        p[0] = p[1]
+
+    def p_balance_opt1(self, p):
+        '''balance_opt : BALANCE AMOUNT symbol_opt'''
+        self.assertions += 1
+        p[0] = ast.Amount(amount=p[2], symbol=p[3])
+
+    def p_balance_opt2(self, p):
+        '''balance_opt : empty'''
+        p[0] = p[1]
+
     def p_symbol_opt(self, p):
         '''symbol_opt : SYMBOL
                       | empty'''
@@ -133,15 +294,84 @@ class LedgerParser:
     def p_error(self, p):
         # TODO Clean up error reporting.
         if p is None:
-            logger.error('Unexpected EOF?')
+            raise SyntaxError('Unexpected end of file', (None, 0, 0, None))
         else:
-            logger.error('{}:{}:Syntax error'.format(p.lineno, p.lexpos))
-            raise SyntaxError
+            raise SyntaxError('Syntax error',
+                              (None, p.lineno, p.lexpos + 1, None))
+
+    def expression_error(self, p, n, e):
+        raise ParseError(e.message, p.lineno(n), p.lexpos(n) + e.pos + 1)
 
-    def __init__(self, lexer, **kw):
+    def __init__(self, lexer=None, **kw):
+        # The lexer may also be given per call, so one parser can parse
+        # many documents, one at a time.
         self.lexer = lexer
-        self.tokens = lexer.tokens
+        self.year = None
+        self.assertions = 0
+        self.tokens = LedgerLexer.tokens
         self.parser = yacc.yacc(module=self, **kw)
 
-    def parse(self):
-        return self.parser.parse(lexer=self.lexer)
+    def reset(self):
+        self.year = None
+        self.assertions = 0
+
+    def parse(self, lexer=None):
+        if lexer is None:
+            lexer = self.lexer
+        self.reset()
+        return self.parser.parse(lexer=lexer)
+
+    def items(self, lexer=None):
+        # Parses one entry at a time as a journal of its own, so items can
+        # be consumed while the rest of the file is still unread.
+        if lexer is None:
+            lexer = self.lexer
+        self.reset()
+        name = lexer.state.file.name
+        for entry in lexer.entries():
+            if entry[0].type == 'EOF':
+                continue
+            last = entry[-1]
+            entry.append(LexToken('EOF', name, last.lineno, last.lexpos))
+            yield from self.parser.parse(lexer=TokenBatch(entry))
+
+
+class ParserPool:
+    # A parser keeps state while it parses, so it can only be used by one
+    # thread at a time. The pool hands out idle parsers and builds another
+    # one when all of them are in use, so threads never wait for each
+    # other and the grammar is only set up once per concurrent parse.
+    def __init__(self, size=0, **kw):
+        self.kw = kw
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        for i in range(size):
+            self.idle.put(self.build())
+
+    def build(self):
+        # Building may write the parse tables, do not race other threads.
+        with self.lock:
+            return LedgerParser(errorlog=yacc.NullLogger(), **self.kw)
+
+    @contextmanager
+    def parser(self):
+        try:
+            parser = self.idle.get_nowait()
+        except queue.Empty:
+            parser = self.build()
+        try:
+            yield parser
+        finally:
+            self.idle.put(parser)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def default_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParserPool()
+        return _pool
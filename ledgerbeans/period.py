@@ -0,0 +1,156 @@
+import calendar
+import datetime
+
+from ledgerbeans.date import from_ordinal, parse_date
+
+
+periods = ['daily', 'weekly', 'monthly', 'quarterly', 'yearly']
+
+
+def add_months(date, months):
+    month = date.month - 1 + months
+    return datetime.date(date.year + month // 12, month % 12 + 1, 1)
+
+
+def period_start(ordinal, period):
+    if period == 'daily':
+        return ordinal
+    elif period == 'weekly':
+        # Ordinal 1 is a Monday, weeks start on Monday.
+        return ordinal - (ordinal - 1) % 7
+    date = from_ordinal(ordinal)
+    if period == 'monthly':
+        return date.replace(day=1).toordinal()
+    elif period == 'quarterly':
+        month = date.month - (date.month - 1) % 3
+        return date.replace(month=month, day=1).toordinal()
+    elif period == 'yearly':
+        return date.replace(month=1, day=1).toordinal()
+    raise ValueError('Unknown period {!r}'.format(period))
+
+
+def period_end(start, period):
+    # Returns the start of the next period.
+    if period == 'daily':
+        return start + 1
+    elif period == 'weekly':
+        return start + 7
+    date = from_ordinal(start)
+    if period == 'monthly':
+        return add_months(date, 1).toordinal()
+    elif period == 'quarterly':
+        return add_months(date, 3).toordinal()
+    elif period == 'yearly':
+        return date.replace(year=date.year + 1).toordinal()
+    raise ValueError('Unknown period {!r}'.format(period))
+
+
+# Period expressions of periodic transactions, such as 'monthly' or
+# 'every 2 weeks from 2020/01/06 to 2021/01/01', step by (unit, count).
+interval_words = {
+    'daily': ('days', 1),
+    'weekly': ('days', 7),
+    'biweekly': ('days', 14),
+    'monthly': ('months', 1),
+    'bimonthly': ('months', 2),
+    'quarterly': ('months', 3),
+    'yearly': ('months', 12),
+    'annually': ('months', 12),
+}
+
+unit_words = {
+    'day': ('days', 1),
+    'week': ('days', 7),
+    'month': ('months', 1),
+    'quarter': ('months', 3),
+    'year': ('months', 12),
+}
+
+
+class Interval:
+    def __init__(self, unit, count, begin=None, end=None):
+        self.unit = unit
+        self.count = count
+        # The first occurrence, and the end before which they stop.
+        self.begin = begin
+        self.end = end
+
+    def alignment(self):
+        # The period whose starts occurrences fall on without a begin date.
+        if self.unit == 'days':
+            return 'weekly' if self.count % 7 == 0 else 'daily'
+        if self.count % 12 == 0:
+            return 'yearly'
+        if self.count % 3 == 0:
+            return 'quarterly'
+        return 'monthly'
+
+    def occurrence(self, anchor, i):
+        # The ordinal of occurrence i counted from the one on anchor. Months
+        # keep the day of anchor where the month has it.
+        if self.unit == 'days':
+            return anchor + i * self.count
+        date = from_ordinal(anchor)
+        month = date.month - 1 + i * self.count
+        year = date.year + month // 12
+        month = month % 12 + 1
+        days = calendar.monthrange(year, month)[1]
+        return datetime.date(year, month, min(date.day, days)).toordinal()
+
+    def ordinals(self, begin, end):
+        # Yields the ordinals of the occurrences in [begin, end).
+        if self.begin is not None:
+            anchor = self.begin
+            begin = max(begin, self.begin)
+        else:
+            anchor = period_start(begin, self.alignment())
+        if self.end is not None:
+            end = min(end, self.end)
+        i = 0
+        if self.unit == 'days' and begin > anchor:
+            i = (begin - anchor) // self.count
+        while True:
+            ordinal = self.occurrence(anchor, i)
+            if ordinal >= end:
+                return
+            if ordinal >= begin:
+                yield ordinal
+            i += 1
+
+
+def parse_interval(text):
+    # Raises ValueError for what is not a period expression. Dates are
+    # written as on the command line.
+    words = text.lower().split()
+    begin = end = None
+    interval = None
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in interval_words and interval is None:
+            interval = interval_words[word]
+        elif word == 'every' and interval is None:
+            count = 1
+            if i + 1 < len(words) and words[i + 1].isdecimal():
+                i += 1
+                count = int(words[i])
+            i += 1
+            unit = words[i].rstrip('s') if i < len(words) else None
+            if unit not in unit_words or count < 1:
+                raise ValueError('Invalid interval in period {!r}'.format(
+                    text))
+            unit, step = unit_words[unit]
+            interval = (unit, step * count)
+        elif word == 'from' and i + 1 < len(words):
+            i += 1
+            begin = parse_date(words[i])
+        elif word in ('to', 'until') and i + 1 < len(words):
+            i += 1
+            end = parse_date(words[i])
+        else:
+            raise ValueError('Unexpected {!r} in period {!r}'.format(word,
+                                                                     text))
+        i += 1
+    if interval is None:
+        raise ValueError('Missing interval in period {!r}'.format(text))
+    return Interval(interval[0], interval[1], begin, end)
@@ -0,0 +1,84 @@
+import datetime
+import heapq
+
+from ledgerbeans import ast
+from ledgerbeans.date import from_ordinal
+from ledgerbeans.loader import LoadError, date_key, merge_transactions
+from ledgerbeans.shard import is_manifest
+
+
+# Forecasts without an end date stop this many years after they begin.
+horizon_years = 5
+
+
+def check_forecast(files):
+    # A manifest loads only some of its shards, and with them only some of
+    # the periodic transactions.
+    for f in files:
+        if is_manifest(f.name):
+            raise LoadError(f.name, 0, 0, 'Cannot forecast from shard '
+                            'manifests, use the ledger files')
+
+
+def periodic_transactions(journals):
+    for journal in journals:
+        for item in journal:
+            if isinstance(item, ast.PeriodicTransaction):
+                yield item
+
+
+def occurrence(template, ordinal):
+    # The postings share the account and amount objects of the template,
+    # only the transaction and posting nodes are new.
+    children = []
+    for post in template:
+        if isinstance(post, ast.Posting):
+            copy = ast.Posting(account=post.account,
+                               amount=post.amount,
+                               note=post.note,
+                               status=post.status,
+                               lot=post.lot,
+                               price=post.price,
+                               lineno=post.lineno)
+            copy.inferred = post.inferred
+            children.append(copy)
+    return ast.Transaction(date=from_ordinal(ordinal),
+                           description=template.text,
+                           source=template.source,
+                           lineno=template.lineno,
+                           children=children)
+
+
+def occurrences(template, begin, end):
+    # Yields the occurrences of template in [begin, end) one at a time, so
+    # only the ones a report reaches are created.
+    for ordinal in template.interval.ordinals(begin, end):
+        yield occurrence(template, ordinal)
+
+
+def forecast(journals, begin=None, end=None):
+    # The occurrences of the periodic transactions of journals in date
+    # order. They start at begin, or today, as the transactions before it
+    # are the ones that happened.
+    if begin is None:
+        begin = datetime.date.today().toordinal()
+    if end is None:
+        date = from_ordinal(begin)
+        try:
+            end = date.replace(year=date.year + horizon_years).toordinal()
+        except ValueError:
+            end = date.replace(year=date.year + horizon_years,
+                               day=28).toordinal()
+    return heapq.merge(*[occurrences(template, begin, end)
+                         for template in periodic_transactions(journals)],
+                       key=date_key)
+
+
+def forecast_transactions(journals, begin=None, end=None, transactions=None):
+    # Merges the forecast into the transactions of journals, or into
+    # transactions when given. On the same date real transactions come
+    # first.
+    if transactions is None:
+        transactions = merge_transactions(journals)
+    return heapq.merge(transactions, forecast(journals, begin, end),
+                       key=date_key)
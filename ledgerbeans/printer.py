@@ -39,6 +39,22 @@ def transaction_printer(xact):
     return
 
 
+def automated_transaction_printer(rule):
+    yield 'automated_transaction(patterns={0.patterns})'.format(rule)
+    for item in rule:
+        for line in printer(item):
+            yield ' ' + line
+    return
+
+
+def periodic_transaction_printer(xact):
+    yield 'periodic_transaction(period={0.text})'.format(xact)
+    for item in xact:
+        for line in printer(item):
+            yield ' ' + line
+    return
+
+
 def post_printer(post):
     args = []
     if post.account is not None:
@@ -47,6 +63,18 @@ def post_printer(post):
     if post.amount is not None:
         for line in printer(post.amount):
             args.append(line)
+    if post.lot is not None:
+        args.extend(args_printer_helper(post.lot, ['date', 'total']))
+        if post.lot.cost is not None:
+            for line in printer(post.lot.cost):
+                args.append('cost=' + line)
+    if post.price is not None:
+        for line in printer(post.price.amount):
+            args.append(('total_price=' if post.price.total else 'price=') +
+                        line)
+    if post.balance is not None:
+        for line in printer(post.balance):
+            args.append('balance=' + line)
     if post.note is not None:
         for line in printer(post.note):
             args.append(line)
@@ -54,6 +82,11 @@ def post_printer(post):
     return
 
 
+def expression_printer(expression):
+    yield '{0.kind}(text={0.text})'.format(expression)
+    return
+
+
 def account_printer(account):
     yield 'account(name={0.name})'.format(account)
     return
@@ -65,7 +98,10 @@ def amount_printer(amount):
 
 
 def note_printer(note):
-    yield 'note(text={0.text})'.format(note)
+    if note.tags:
+        yield 'note(text={0.text}, tags={0.tags})'.format(note)
+    else:
+        yield 'note(text={0.text})'.format(note)
     return
 
 
@@ -74,6 +110,11 @@ def comment_printer(comment):
     return
 
 
+def year_printer(year):
+    yield 'year(year={0.year})'.format(year)
+    return
+
+
 def empty_line_printer(item):
     yield 'emptyline()'
     return
@@ -84,9 +125,22 @@ def register(registry=None):
         registry = reg.Registry()
     registry.register(printer, [ast.Journal], journal_printer)
     registry.register(printer, [ast.Transaction], transaction_printer)
+    registry.register(printer, [ast.AutomatedTransaction],
+                      automated_transaction_printer)
+    registry.register(printer, [ast.PeriodicTransaction],
+                      periodic_transaction_printer)
     registry.register(printer, [ast.Posting], post_printer)
+    registry.register(printer, [ast.Expression], expression_printer)
     registry.register(printer, [ast.Account], account_printer)
     registry.register(printer, [ast.Amount], amount_printer)
     registry.register(printer, [ast.Note], note_printer)
     registry.register(printer, [ast.Comment], comment_printer)
+    registry.register(printer, [ast.Year], year_printer)
     registry.register(printer, [ast.EmptyLine], empty_line_printer)
+
+
+def initialize(registry=None):
+    if registry is None:
+        registry = reg.Registry()
+    register(registry)
+    reg.implicit.initialize(registry)
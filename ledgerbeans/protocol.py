@@ -0,0 +1,19 @@
+import json
+import os
+
+
+def default_socket_path():
+    try:
+        return os.environ['LEDGERBEANS_SOCKET']
+    except KeyError:
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+        return os.path.join(runtime_dir,
+                            'ledgerbeans-{}.sock'.format(os.getuid()))
+
+
+def encode(message):
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+def decode(line):
+    return json.loads(line.decode('utf-8'))
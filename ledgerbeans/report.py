@@ -0,0 +1,250 @@
+import re
+
+from ledgerbeans import ast
+
+
+def account_matcher(patterns=None):
+    if not patterns:
+        return lambda name: True
+    regex = re.compile('|'.join('(?:{})'.format(p) for p in patterns),
+                       re.IGNORECASE)
+    return lambda name: regex.search(name) is not None
+
+
+def date_range(transactions, begin=None, end=None):
+    for xact in transactions:
+        if begin is not None and xact.ordinal < begin:
+            continue
+        if end is not None and xact.ordinal >= end:
+            continue
+        yield xact
+
+
+text_fields = {
+    'payee:': 'payee',
+    'desc:': 'payee',
+    'note:': 'note',
+}
+
+
+def has_item_terms(terms):
+    # Whether terms select postings by more than their account, which the
+    # totals kept by shards and snapshots cannot answer.
+    return any(term.startswith(prefix) for term in terms
+               for prefix in ('tag:',) + tuple(text_fields))
+
+
+class Query:
+    # Terms of the form tag:KEY or tag:KEY=VALUE select postings through
+    # the tag indexes of the journals. Terms of the form payee:TEXT, or
+    # desc:TEXT, and note:TEXT select the transactions whose description or
+    # notes contain TEXT, ignoring case, through their text indexes. All
+    # other terms are account patterns.
+    def __init__(self, terms=None, journals=(), keep_index=False):
+        patterns = []
+        self.postings = None
+        self.transactions = None
+        for term in terms or []:
+            prefix, sep, text = term.partition(':')
+            if sep and prefix + sep in text_fields:
+                from ledgerbeans.textindex import text_index
+
+                field = text_fields[prefix + sep]
+                found = set()
+                for journal in journals:
+                    found.update(text_index(journal, keep_index).search(
+                        field, text))
+                if self.transactions is None:
+                    self.transactions = found
+                else:
+                    self.transactions &= found
+            elif term.startswith('tag:'):
+                key, sep, value = term[4:].partition('=')
+                found = set()
+                for journal in journals:
+                    found.update(journal.tag_index.postings(
+                        key, value if sep else None))
+                if self.postings is None:
+                    self.postings = found
+                else:
+                    self.postings &= found
+            else:
+                patterns.append(term)
+        self.match_account = account_matcher(patterns)
+
+    def __call__(self, post):
+        if self.postings is not None and post not in self.postings:
+            return False
+        if self.transactions is not None and \
+           post.parent not in self.transactions:
+            return False
+        return self.match_account(post.account.name)
+
+
+def balance_group(account):
+    if account.flags['virtual']:
+        if account.flags['balanced']:
+            return 'balanced'
+        return None
+    return 'real'
+
+
+def exchanged_amount(quantity, annotation, price):
+    # The amount quantity units are worth at price, an Amount per unit or
+    # for all units when annotation.total is set.
+    if annotation.total:
+        return price.amount.copy_sign(quantity), price.symbol
+    return quantity * price.amount, price.symbol
+
+
+def balance_amount(post):
+    # The quantity and commodity a posting adds to the balance of its
+    # transaction: the cost of its lot, or else its price, or else its
+    # amount.
+    amount = post.amount
+    if post.lot is not None and post.lot.cost is not None:
+        return exchanged_amount(amount.amount, post.lot, post.lot.cost)
+    if post.price is not None:
+        return exchanged_amount(amount.amount, post.price, post.price.amount)
+    return amount.amount, amount.symbol
+
+
+def posting_amounts(xact):
+    # Yields (posting, quantity, commodity) for every posting, where the
+    # posting without an amount receives the remainder of its group. The
+    # parser infers that amount when it is in a single commodity, so the
+    # remainders are only summed for the transactions left.
+    null_posts = {}
+    for post in xact:
+        if isinstance(post, ast.Posting):
+            if post.amount is None:
+                null_posts[balance_group(post.account)] = post
+            else:
+                yield post, post.amount.amount, post.amount.symbol
+    if not null_posts:
+        return
+    sums = {}
+    for post in xact:
+        if not isinstance(post, ast.Posting) or post.amount is None:
+            continue
+        group = balance_group(post.account)
+        if group is not None:
+            quantity, commodity = balance_amount(post)
+            group_sums = sums.setdefault(group, {})
+            group_sums[commodity] = group_sums.get(commodity, 0) + quantity
+    for group, post in null_posts.items():
+        for commodity, quantity in sums.get(group, {}).items():
+            yield post, -quantity, commodity
+
+
+def symbol_of(commodity):
+    return commodity[0] if commodity is not None else None
+
+
+def format_amount(quantity, commodity=None):
+    if commodity is None:
+        return str(quantity)
+    symbol, flags = commodity
+    sep = ' ' if 'S' in flags else ''
+    if 'P' in flags:
+        return '{}{}{}'.format(symbol, sep, quantity)
+    return '{}{}{}'.format(quantity, sep, symbol)
+
+
+class Totals:
+    def __init__(self):
+        self.quantities = {}
+        self.styles = {}
+
+    def add(self, quantity, commodity):
+        if commodity is None:
+            symbol = None
+        else:
+            symbol = commodity[0]
+            self.styles.setdefault(symbol, commodity)
+        self.quantities[symbol] = self.quantities.get(symbol, 0) + quantity
+
+    def update(self, other):
+        for symbol, quantity in other.quantities.items():
+            self.add(quantity, other.styles.get(symbol))
+
+    def lines(self):
+        lines = []
+        for symbol in sorted(self.quantities, key=lambda s: s or ''):
+            quantity = self.quantities[symbol]
+            if quantity:
+                lines.append(format_amount(quantity,
+                                           self.styles.get(symbol)))
+        if not lines:
+            lines.append('0')
+        return lines
+
+
+def balance_report(transactions, query=None, openings=None):
+    if query is None:
+        query = Query()
+    accounts = {}
+    if openings is not None:
+        for name, totals in openings.items():
+            if query.match_account(name):
+                accounts.setdefault(name, Totals()).update(totals)
+    for xact in transactions:
+        for post, quantity, commodity in posting_amounts(xact):
+            if query(post):
+                accounts.setdefault(post.account.name,
+                                    Totals()).add(quantity, commodity)
+    return balance_lines(accounts)
+
+
+def balance_lines(accounts):
+    total = Totals()
+    for name in sorted(accounts):
+        totals = accounts[name]
+        total.update(totals)
+        lines = totals.lines()
+        for amount in lines[:-1]:
+            yield '{:>20}'.format(amount)
+        yield '{:>20}  {}'.format(lines[-1], name)
+    yield '-' * 20
+    for amount in total.lines():
+        yield '{:>20}'.format(amount)
+
+
+def truncate(text, width):
+    if len(text) > width:
+        return text[:width - 2] + '..'
+    return text
+
+
+def register_report(transactions, query=None):
+    if query is None:
+        query = Query()
+    return register_lines(register_rows(transactions, query))
+
+
+def register_rows(transactions, query):
+    for xact in transactions:
+        for post, quantity, commodity in posting_amounts(xact):
+            if query(post):
+                yield (xact, xact.date, xact.description, post.account.name,
+                       quantity, commodity)
+
+
+def register_lines(rows):
+    # Rows are (key, date, description, account, quantity, commodity),
+    # where consecutive rows with the same key belong to one transaction.
+    total = Totals()
+    last = None
+    for key, date, description, name, quantity, commodity in rows:
+        if key == last:
+            header = ''
+        else:
+            header = '{!s:10} {:22}'.format(date, truncate(description, 22))
+            last = key
+        total.add(quantity, commodity)
+        running = total.lines()
+        yield '{:33} {:24} {:>14} {:>14}'.format(
+            header, truncate(name, 24),
+            format_amount(quantity, commodity), running[0])
+        for amount in running[1:]:
+            yield '{:>88}'.format(amount)
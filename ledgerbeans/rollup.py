@@ -0,0 +1,139 @@
+import heapq
+import logging
+import pickle
+import tempfile
+
+from ledgerbeans.date import from_ordinal
+from ledgerbeans.period import period_end, period_start
+from ledgerbeans.report import Query, Totals, posting_amounts
+
+
+logger = logging.getLogger(__name__)
+
+
+class SpilledRun:
+    def __init__(self, rows):
+        self.file = tempfile.TemporaryFile()
+        for row in rows:
+            pickle.dump(row, self.file, pickle.HIGHEST_PROTOCOL)
+        self.file.seek(0)
+
+    def __iter__(self):
+        try:
+            while True:
+                yield pickle.load(self.file)
+        except EOFError:
+            self.file.close()
+
+
+class ReorderBuffer:
+    # Holds rows until no row with an earlier date can arrive anymore, that
+    # is until a row dated more than window days later has been seen. Rows
+    # beyond limit are spilled to sorted runs in temporary files.
+    def __init__(self, window=0, limit=100000):
+        self.window = window
+        self.limit = limit
+        self.heap = []
+        self.runs = []
+        self.seq = 0
+        self.newest = None
+
+    def push(self, row):
+        # Rows are (ordinal, ...) tuples, the sequence number keeps rows on
+        # the same date in arrival order.
+        self.heap.append((row[0], self.seq, row))
+        self.seq += 1
+        if len(self.heap) >= self.limit:
+            self.spill()
+        if self.newest is None or row[0] > self.newest:
+            self.newest = row[0]
+            return self.release(self.newest - self.window)
+        return iter(())
+
+    def spill(self):
+        self.heap.sort()
+        run = iter(SpilledRun(self.heap))
+        self.heap = []
+        head = next(run, None)
+        if head is not None:
+            heapq.heappush(self.runs, (head, run))
+
+    def release(self, watermark=None):
+        heap = self.heap
+        heapq.heapify(heap)
+        while True:
+            if self.runs and (not heap or self.runs[0][0] < heap[0]):
+                entry, run = heapq.heappop(self.runs)
+                head = next(run, None)
+                if head is not None:
+                    heapq.heappush(self.runs, (head, run))
+            elif heap:
+                entry = heap[0]
+                if watermark is not None and entry[0] > watermark:
+                    break
+                heapq.heappop(heap)
+            else:
+                break
+            if watermark is not None and entry[0] > watermark:
+                # Only reached for run entries, put it back.
+                heapq.heappush(heap, entry)
+                break
+            yield entry[2]
+
+    def flush(self):
+        return self.release()
+
+
+def posting_rows(transactions, query=None):
+    if query is None:
+        query = Query()
+    for xact in transactions:
+        for post, quantity, commodity in posting_amounts(xact):
+            if query(post):
+                yield (xact.ordinal, post.account.name, commodity, quantity)
+
+
+def rollup(rows, period, window=0, limit=100000):
+    # Yields (start, end, accounts) for every period with postings, as soon
+    # as a row of a later period is released from the reorder buffer. Only
+    # the accumulators of the open period are kept.
+    buffer = ReorderBuffer(window, limit)
+    start = end = None
+    accounts = {}
+
+    def consume(released):
+        nonlocal start, end, accounts
+        for ordinal, account, commodity, quantity in released:
+            if start is None:
+                start = period_start(ordinal, period)
+                end = period_end(start, period)
+            elif ordinal >= end:
+                yield start, end, accounts
+                accounts = {}
+                start = period_start(ordinal, period)
+                end = period_end(start, period)
+            elif ordinal < start:
+                logger.warning('Posting dated {} is too far out of date '
+                               'order, adding it to the period starting '
+                               '{}; consider a larger reorder '
+                               'window'.format(from_ordinal(ordinal),
+                                               from_ordinal(start)))
+            accounts.setdefault(account, Totals()).add(quantity, commodity)
+
+    for row in rows:
+        yield from consume(buffer.push(row))
+    yield from consume(buffer.flush())
+    if start is not None:
+        yield start, end, accounts
+
+
+def rollup_report(transactions, period, query=None, window=0,
+                  limit=100000):
+    rows = posting_rows(transactions, query)
+    for start, end, accounts in rollup(rows, period, window, limit):
+        header = '{} - {}'.format(from_ordinal(start),
+                                  from_ordinal(end - 1))
+        for name in sorted(accounts):
+            for amount in accounts[name].lines():
+                yield '{:23} {:40} {:>14}'.format(header, name, amount)
+                header = ''
@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+
+from concurrent.futures import ProcessPoolExecutor
+
+from ledgerbeans import protocol
+from ledgerbeans.loader import (LoadError, check_balances, load_file,
+                                merge_transactions)
+from ledgerbeans.date import parse_date
+from ledgerbeans.printer import printer
+from ledgerbeans.report import (Query, balance_report, date_range,
+                                register_report)
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryArgumentParser(argparse.ArgumentParser):
+    # Bad arguments fail the query, not the server.
+    def error(self, message):
+        raise ValueError(message)
+
+
+query_parser = QueryArgumentParser(add_help=False)
+query_parser.add_argument('-b', '--begin', type=parse_date)
+query_parser.add_argument('-e', '--end', type=parse_date)
+query_parser.add_argument('patterns', nargs='*')
+
+
+def query_transactions(journals, args):
+    return date_range(merge_transactions(journals), args.begin, args.end)
+
+
+def query_ast(journals, args):
+    for journal in journals:
+        yield from printer(journal)
+
+
+def query_balance(journals, args):
+    return balance_report(query_transactions(journals, args),
+                          Query(args.patterns, journals))
+
+
+def query_register(journals, args):
+    return register_report(query_transactions(journals, args),
+                           Query(args.patterns, journals))
+
+
+class JournalServer:
+    queries = {
+        'ast': query_ast,
+        'balance': query_balance,
+        'register': query_register,
+    }
+
+    def __init__(self, filenames, socket_path, interval=1.0, debug=False,
+                 jobs=None):
+        self.filenames = filenames
+        self.socket_path = socket_path
+        self.interval = interval
+        self.debug = debug
+        self.journals = [None] * len(filenames)
+        self.signatures = [None] * len(filenames)
+        self.checker = None
+        self.pool = ProcessPoolExecutor(max_workers=jobs)
+
+    def stat(self, filename):
+        stat = os.stat(filename)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    async def reload(self, i):
+        loop = asyncio.get_event_loop()
+        filename = self.filenames[i]
+        signature = self.stat(filename)
+        try:
+            journal = await loop.run_in_executor(self.pool, load_file,
+                                                 filename, self.debug)
+        except LoadError as e:
+            logger.error(str(e))
+            if self.journals[i] is not None:
+                logger.error('Keeping previously loaded {}'.format(filename))
+            journal = None
+        # Do not retry until the file changes again.
+        self.signatures[i] = signature
+        return journal
+
+    async def reload_all(self, changed):
+        changed = list(changed)
+        results = await asyncio.gather(*[self.reload(i) for i in changed])
+        journals = list(self.journals)
+        for i, journal in zip(changed, results):
+            if journal is not None:
+                journals[i] = journal
+        if None in journals:
+            return False
+        # Balance assertions are checked again from the first changed
+        # transaction on only.
+        try:
+            self.checker = check_balances(journals, checker=self.checker)
+        except LoadError as e:
+            logger.error(str(e))
+            if self.journals[0] is not None:
+                logger.error('Keeping previously loaded journals')
+            return False
+        self.journals = journals
+        # Keep the long-lived journals out of future collections, they are
+        # freed by reference counting when replaced.
+        gc.freeze()
+        for i, journal in zip(changed, results):
+            if journal is not None:
+                logger.info('Loaded {}'.format(self.filenames[i]))
+        return all(journal is not None for journal in results)
+
+    def changed(self):
+        for i, filename in enumerate(self.filenames):
+            try:
+                signature = self.stat(filename)
+            except OSError as e:
+                logger.warning('Cannot stat {}: {}'.format(filename, e))
+                continue
+            if signature != self.signatures[i]:
+                yield i
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            changed = list(self.changed())
+            if changed:
+                await self.reload_all(changed)
+
+    def answer(self, journals, request):
+        try:
+            query = self.queries[request['command']]
+        except (KeyError, TypeError):
+            return {'status': 'error',
+                    'message': 'Unknown query {!r}'.format(request)}
+        try:
+            args = query_parser.parse_args(request.get('args') or [])
+            output = list(query(journals, args))
+        except Exception as e:
+            # Such as an account pattern that is not a valid regular
+            # expression, the connection stays open for the next query.
+            logger.warning('Query {!r} failed: {}'.format(request, e))
+            return {'status': 'error',
+                    'message': '{}: {}'.format(request['command'], e)}
+        return {'status': 'ok', 'output': output}
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = protocol.decode(line)
+                except ValueError:
+                    response = {'status': 'error',
+                                'message': 'Malformed request'}
+                else:
+                    # Queries run against the journals that were current
+                    # when they arrived, a reload only swaps the list.
+                    response = await loop.run_in_executor(
+                        None, self.answer, self.journals, request)
+                writer.write(protocol.encode(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+        else:
+            raise OSError('Server already listening on {}'.format(
+                self.socket_path))
+        finally:
+            sock.close()
+
+    async def serve(self):
+        if not await self.reload_all(range(len(self.filenames))):
+            return
+        self.remove_stale_socket()
+        server = await asyncio.start_unix_server(self.handle,
+                                                 path=self.socket_path)
+        logger.info('Listening on {}'.format(self.socket_path))
+        watcher = asyncio.ensure_future(self.watch())
+        serving = asyncio.ensure_future(server.serve_forever())
+        asyncio.get_event_loop().add_signal_handler(signal.SIGTERM,
+                                                    serving.cancel)
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+        finally:
+            watcher.cancel()
+            server.close()
+            self.pool.shutdown()
+            os.unlink(self.socket_path)
+
+    def run(self):
+        asyncio.run(self.serve())
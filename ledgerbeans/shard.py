@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from ledgerbeans import ast
+from ledgerbeans.compressed import open_input
+from ledgerbeans.date import from_ordinal, parse_date
+from ledgerbeans.entry import is_year_directive, read_entries
+from ledgerbeans.loader import LoadError, gc_disabled, load_file
+from ledgerbeans.period import period_end, period_start
+from ledgerbeans.report import Totals, posting_amounts
+
+
+logger = logging.getLogger(__name__)
+
+
+shard_periods = ['monthly', 'quarterly', 'yearly']
+
+cache_dirname = '.ledgerbeans-cache'
+
+
+def is_manifest(filename):
+    return filename.endswith('.json')
+
+
+def checksum(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def journal_totals(journal):
+    accounts = {}
+    for xact in journal.transactions():
+        for post, quantity, commodity in posting_amounts(xact):
+            accounts.setdefault(post.account.name,
+                                Totals()).add(quantity, commodity)
+    return accounts
+
+
+def encode_totals(accounts):
+    rows = []
+    for name in sorted(accounts):
+        totals = accounts[name]
+        for symbol, quantity in totals.quantities.items():
+            commodity = totals.styles.get(symbol)
+            flags = commodity[1] if commodity is not None else None
+            rows.append([name, symbol, flags, str(quantity)])
+    return rows
+
+
+def decode_totals(rows, accounts=None):
+    if accounts is None:
+        accounts = {}
+    for name, symbol, flags, quantity in rows:
+        commodity = (symbol, flags) if symbol is not None else None
+        accounts.setdefault(name, Totals()).add(Decimal(quantity), commodity)
+    return accounts
+
+
+class Shard:
+    def __init__(self, filename, begin, end, checksum=None, totals=None):
+        self.filename = filename
+        self.begin = begin
+        self.end = end
+        self.checksum = checksum
+        self.totals = totals or []
+
+    def to_json(self):
+        return {
+            'file': self.filename,
+            'begin': from_ordinal(self.begin).isoformat(),
+            'end': from_ordinal(self.end).isoformat(),
+            'sha256': self.checksum,
+            'totals': self.totals,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['file'],
+                   parse_date(data['begin']),
+                   parse_date(data['end']),
+                   data['sha256'],
+                   data['totals'])
+
+
+class Manifest:
+    # A manifest lists the shards of a journal in date order. Each shard
+    # covers [begin, end) and records the checksum it was last parsed with
+    # and its own per-account totals, the opening balances of a shard are
+    # the sum of the totals of the shards before it.
+    def __init__(self, filename, period='monthly', shards=None):
+        self.filename = filename
+        self.directory = os.path.dirname(os.path.abspath(filename))
+        self.period = period
+        self.shards = shards or []
+
+    @classmethod
+    def read(cls, filename):
+        with open(filename) as f:
+            data = json.load(f)
+        return cls(filename, data['period'],
+                   [Shard.from_json(s) for s in data['shards']])
+
+    def write(self):
+        data = {
+            'version': 1,
+            'period': self.period,
+            'shards': [s.to_json() for s in self.shards],
+        }
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=1)
+            f.write('\n')
+        os.replace(tmp, self.filename)
+
+    def path(self, shard):
+        return os.path.join(self.directory, shard.filename)
+
+    def cache_path(self, shard, checksum):
+        return os.path.join(self.directory, cache_dirname,
+                            '{}.{}.pickle'.format(shard.filename,
+                                                  checksum[:16]))
+
+    def select(self, begin=None, end=None):
+        return [s for s in self.shards
+                if (begin is None or s.end > begin) and
+                (end is None or s.begin < end)]
+
+    def last_shard(self, end=None):
+        # The shard holding the last date before end.
+        shards = self.select(end=end)
+        if shards:
+            return shards[-1]
+        return None
+
+    def opening(self, shard):
+        accounts = {}
+        for s in self.shards:
+            if s is shard:
+                break
+            decode_totals(s.totals, accounts)
+        return accounts
+
+
+def is_rule(entry):
+    # Automated and periodic transactions apply across dates, a shard
+    # would only see them when it holds them.
+    return any(line[:1] in ('=', '~') for line in entry.lines)
+
+
+def split(f, manifest, period='monthly'):
+    # Distributes the entries of f over one shard file per period. Every
+    # shard starts with a year directive, so partial dates keep their year.
+    # Comments and directives go with the transaction after them, those at
+    # the end of the file with the last transaction. Raises ValueError for
+    # files with automated or periodic transactions.
+    outputs = {}
+    shards = {}
+    pending = []
+    start = None
+    try:
+        for entry in read_entries(open_input(f)):
+            if entry.ordinal is None:
+                if is_rule(entry):
+                    raise ValueError('Line {}:Cannot shard automated or '
+                                     'periodic transactions'.format(
+                                         entry.lineno))
+                pending.append(entry)
+                continue
+            start = period_start(entry.ordinal, period)
+            if start not in outputs:
+                begin = from_ordinal(start)
+                name = '{}.ledger'.format(begin.strftime('%Y-%m-%d'))
+                shards[start] = Shard(name, start, period_end(start, period))
+                outputs[start] = open(manifest.path(shards[start]), 'w')
+                outputs[start].write('year {}\n'.format(begin.year))
+            pending.append(entry)
+            write_entries(outputs[start], pending)
+            pending = []
+        if pending:
+            if start is None:
+                raise ValueError('No transactions to shard')
+            write_entries(outputs[start], pending)
+    finally:
+        for output in outputs.values():
+            output.close()
+    manifest.period = period
+    manifest.shards = [shards[start] for start in sorted(shards)]
+
+
+def write_entries(output, entries):
+    for entry in entries:
+        for line in entry.lines:
+            if not is_year_directive(line):
+                output.write(line)
+
+
+def parse_shard(path, cache_path, debug=False):
+    journal = load_file(path, debug=debug)
+    if journal.assertions:
+        # The amount of an assignment depends on the shards before it, so
+        # the totals of the shard would not be its own.
+        for xact in journal.transactions():
+            for post in xact:
+                if isinstance(post, ast.Posting) and post.amount is None \
+                   and post.balance is not None:
+                    raise LoadError(path, post.lineno, 1,
+                                    'Balance assignments are not supported '
+                                    'in shards')
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp = cache_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(journal, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache_path)
+    return encode_totals(journal_totals(journal))
+
+
+def remove_stale_caches(manifest, shard, keep):
+    directory = os.path.join(manifest.directory, cache_dirname)
+    prefix = shard.filename + '.'
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith(prefix) and path != keep:
+            os.unlink(path)
+
+
+def refresh(manifest, shards, debug=False, jobs=None, cache=True):
+    # Parses, in worker processes, the shards whose checksum changed or,
+    # when cache is set, that have no cached parse result for it. Shards
+    # whose checksum changed get their totals refreshed in the manifest, so
+    # the opening balances of later shards stay right.
+    stale = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for shard in shards:
+            path = manifest.path(shard)
+            try:
+                current = checksum(path)
+            except OSError as e:
+                raise LoadError(path, 0, 0, e.strerror)
+            cache_path = manifest.cache_path(shard, current)
+            if current != shard.checksum or \
+               (cache and not os.path.exists(cache_path)):
+                futures[shard.filename] = (shard, current, cache_path,
+                                           pool.submit(parse_shard, path,
+                                                       cache_path, debug))
+        for shard, current, cache_path, future in futures.values():
+            shard.totals = future.result()
+            shard.checksum = current
+            remove_stale_caches(manifest, shard, cache_path)
+            stale.append(shard)
+            logger.info('Parsed shard {}'.format(shard.filename))
+    if stale:
+        manifest.write()
+
+
+def load_shards(manifest, shards, debug=False, jobs=None):
+    refresh(manifest, shards, debug=debug, jobs=jobs)
+    journals = {}
+    with gc_disabled():
+        for shard in shards:
+            with open(manifest.cache_path(shard, shard.checksum), 'rb') as f:
+                journals[shard.filename] = pickle.load(f)
+    return [journals[shard.filename] for shard in shards]
+
+
+def load_manifest(filename, debug=False, jobs=None, begin=None, end=None,
+                  openings=None, balances=None):
+    # Loads the shards overlapping [begin, end). When openings is given and
+    # there is no begin date, only the last shard is loaded and the
+    # balances of all shards before it are added to openings instead. The
+    # balances before the first loaded shard are added to balances.
+    manifest = Manifest.read(filename)
+    if openings is not None and begin is None:
+        shard = manifest.last_shard(end)
+        if shard is None:
+            return []
+        earlier = manifest.shards[:manifest.shards.index(shard)]
+        refresh(manifest, earlier, debug=debug, jobs=jobs, cache=False)
+        for name, totals in manifest.opening(shard).items():
+            openings.setdefault(name, Totals()).update(totals)
+        shards = [shard]
+    else:
+        shards = manifest.select(begin, end)
+        if balances is not None and shards:
+            earlier = manifest.shards[:manifest.shards.index(shards[0])]
+            refresh(manifest, earlier, debug=debug, jobs=jobs, cache=False)
+    if balances is not None and shards:
+        for name, totals in manifest.opening(shards[0]).items():
+            balances.setdefault(name, Totals()).update(totals)
+    return load_shards(manifest, shards, debug=debug, jobs=jobs)
@@ -0,0 +1,344 @@
+import bisect
+import heapq
+import json
+import mmap
+import os
+import sys
+
+from array import array
+from decimal import Decimal
+
+from ledgerbeans.date import from_ordinal
+from ledgerbeans.loader import LoadError, merge_transactions
+from ledgerbeans.report import Totals, account_matcher, posting_amounts
+from ledgerbeans.shard import Manifest, checksum, is_manifest
+
+
+magic = b'LBSNAP1\n'
+
+alignment = 8
+
+# Postings are stored in date order, one fixed width column per field.
+posting_columns = [
+    ('date', 'i'),
+    ('xact', 'I'),
+    ('account', 'I'),
+    ('commodity', 'I'),
+    ('quantity', 'q'),
+    ('flags', 'B'),
+]
+
+transaction_columns = [
+    ('payee', 'I'),
+    ('note', 'I'),
+]
+
+string_tables = ['payees', 'notes']
+
+# Posting flags
+cleared = 1
+pending = 2
+virtual = 4
+balanced = 8
+
+
+def is_snapshot(filename):
+    return filename.endswith('.snapshot')
+
+
+def align(offset):
+    return -(-offset // alignment) * alignment
+
+
+def posting_flags(post):
+    flags = 0
+    if post.status['cleared']:
+        flags |= cleared
+    if post.status['pending']:
+        flags |= pending
+    if post.account.flags['virtual']:
+        flags |= virtual
+    if post.account.flags['balanced']:
+        flags |= balanced
+    return flags
+
+
+def decimal_places(quantity):
+    return max(-quantity.as_tuple().exponent, 0)
+
+
+class StringTableWriter:
+    def __init__(self):
+        self.ids = {}
+        self.offsets = array('q', [0])
+        self.data = bytearray()
+
+    def add(self, text):
+        try:
+            return self.ids[text]
+        except KeyError:
+            pass
+        i = self.ids[text] = len(self.ids)
+        self.data += text.encode('utf-8')
+        self.offsets.append(len(self.data))
+        return i
+
+
+class StringTable:
+    # Strings are decoded when they are looked up, not when the snapshot
+    # is opened.
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+def source_files(files):
+    # The files a snapshot is checked against, for a manifest these are
+    # the manifest itself and its shards.
+    sources = []
+    for f in files:
+        if f.name.startswith('<'):
+            continue
+        sources.append(os.path.abspath(f.name))
+        if is_manifest(f.name):
+            manifest = Manifest.read(f.name)
+            sources.extend(manifest.path(s) for s in manifest.shards)
+    return sources
+
+
+def describe_source(path):
+    st = os.stat(path)
+    return {
+        'path': path,
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'sha256': checksum(path),
+    }
+
+
+def write_snapshot(filename, journals, sources):
+    accounts = StringTableWriter()
+    commodities = {}
+    styles = []
+    scales = []
+    payees = StringTableWriter()
+    notes = StringTableWriter()
+    columns = {name: array(fmt) for name, fmt in posting_columns +
+               transaction_columns}
+    # The first pass collects everything but the quantities, which are
+    # stored as integers scaled by the most decimal places their commodity
+    # is written with, and that is only known at the end.
+    for i, xact in enumerate(merge_transactions(journals)):
+        columns['payee'].append(payees.add(xact.description))
+        if xact.note is not None:
+            columns['note'].append(notes.add(xact.note.text) + 1)
+        else:
+            columns['note'].append(0)
+        for post, quantity, commodity in posting_amounts(xact):
+            symbol = commodity[0] if commodity is not None else None
+            c = commodities.get(symbol)
+            if c is None:
+                c = commodities[symbol] = len(styles)
+                styles.append(commodity)
+                scales.append(0)
+            scales[c] = max(scales[c], decimal_places(quantity))
+            columns['date'].append(xact.ordinal)
+            columns['xact'].append(i)
+            columns['account'].append(accounts.add(post.account.name))
+            columns['commodity'].append(c)
+            columns['flags'].append(posting_flags(post))
+    quantities = columns['quantity']
+    for xact in merge_transactions(journals):
+        for post, quantity, commodity in posting_amounts(xact):
+            symbol = commodity[0] if commodity is not None else None
+            scale = scales[commodities[symbol]]
+            try:
+                quantities.append(int(quantity.scaleb(scale)))
+            except OverflowError:
+                raise ValueError('Amount {} does not fit in a '
+                                 'snapshot'.format(quantity))
+
+    sections = [(name, columns[name]) for name, fmt in posting_columns +
+                transaction_columns]
+    for name, table in [('payees', payees), ('notes', notes)]:
+        sections.append((name + '_offsets', table.offsets))
+        sections.append((name + '_data', array('B', table.data)))
+    layout = {}
+    offset = 0
+    for name, column in sections:
+        layout[name] = [column.typecode, offset, len(column)]
+        offset = align(offset + len(column) * column.itemsize)
+    header = json.dumps({
+        'version': 1,
+        'byteorder': sys.byteorder,
+        'sources': [describe_source(path) for path in sources],
+        'accounts': list(accounts.ids),
+        'commodities': [[style[0], style[1], scale]
+                        if style is not None else [None, None, scale]
+                        for style, scale in zip(styles, scales)],
+        'columns': layout,
+    }).encode('utf-8')
+    base = align(len(magic) + 8 + len(header))
+
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(magic)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, column in sections:
+            f.write(b'\0' * (base + layout[name][1] - f.tell()))
+            column.tofile(f)
+    os.replace(tmp, filename)
+
+
+class Snapshot:
+    # Memory maps a snapshot written by write_snapshot(). The columns are
+    # memoryviews on the mapping, so opening a snapshot reads nothing but
+    # the header, and the operating system pages columns in as reports
+    # touch them.
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(len(magic)) != magic:
+                raise ValueError('Not a snapshot')
+            length = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(length).decode('utf-8'))
+            if header['byteorder'] != sys.byteorder:
+                raise ValueError('Snapshot was written with {} endian '
+                                 'byte order'.format(header['byteorder']))
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sources = header['sources']
+        self.accounts = header['accounts']
+        self.commodities = [((symbol, flags) if symbol is not None else None,
+                             scale)
+                            for symbol, flags, scale in header['commodities']]
+        base = align(len(magic) + 8 + length)
+        view = memoryview(self.map)
+        self.columns = {}
+        for name, (fmt, offset, count) in header['columns'].items():
+            start = base + offset
+            size = count * array(fmt).itemsize
+            self.columns[name] = view[start:start + size].cast(fmt)
+        self.payees = StringTable(self.columns['payees_offsets'],
+                                  self.columns['payees_data'])
+        self.notes = StringTable(self.columns['notes_offsets'],
+                                 self.columns['notes_data'])
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stale_source(self):
+        # Returns the first source file that changed since the snapshot was
+        # written. Files of the same size and modification time are taken
+        # to be unchanged without reading them.
+        for source in self.sources:
+            path = source['path']
+            try:
+                st = os.stat(path)
+            except OSError:
+                return path
+            if st.st_size == source['size'] and \
+               st.st_mtime_ns == source['mtime']:
+                continue
+            if st.st_size != source['size'] or \
+               checksum(path) != source['sha256']:
+                return path
+        return None
+
+    def posting_range(self, begin=None, end=None):
+        dates = self.columns['date']
+        lo = 0 if begin is None else bisect.bisect_left(dates, begin)
+        hi = len(dates) if end is None else bisect.bisect_left(dates, end)
+        return lo, hi
+
+    def amount(self, commodity, quantity):
+        style, scale = self.commodities[commodity]
+        return Decimal(quantity).scaleb(-scale), style
+
+    def balances(self, match_account, begin=None, end=None, accounts=None):
+        # Sums the scaled integer quantities per account and commodity, the
+        # only Python objects made per posting are the ints being added.
+        if accounts is None:
+            accounts = {}
+        matched = [match_account(name) for name in self.accounts]
+        lo, hi = self.posting_range(begin, end)
+        sums = {}
+        for account, commodity, quantity in zip(
+                self.columns['account'][lo:hi],
+                self.columns['commodity'][lo:hi],
+                self.columns['quantity'][lo:hi]):
+            if matched[account]:
+                key = (account, commodity)
+                sums[key] = sums.get(key, 0) + quantity
+        for (account, commodity), quantity in sums.items():
+            totals = accounts.setdefault(self.accounts[account], Totals())
+            totals.add(*self.amount(commodity, quantity))
+        return accounts
+
+    def register_rows(self, match_account, begin=None, end=None, key=0):
+        matched = [match_account(name) for name in self.accounts]
+        lo, hi = self.posting_range(begin, end)
+        columns = self.columns
+        payees = columns['payee']
+        for i in range(lo, hi):
+            account = columns['account'][i]
+            if not matched[account]:
+                continue
+            xact = columns['xact'][i]
+            quantity, commodity = self.amount(columns['commodity'][i],
+                                              columns['quantity'][i])
+            yield ((key, xact), columns['date'][i], from_ordinal(
+                columns['date'][i]), self.payees[payees[xact]],
+                self.accounts[account], quantity, commodity)
+
+
+def open_snapshots(files):
+    # Opens the snapshots given with -f, raising LoadError when one of them
+    # is unreadable or older than its source files.
+    snapshots = []
+    for f in files:
+        f.close()
+        try:
+            snapshot = Snapshot(f.name)
+        except (OSError, ValueError, KeyError) as e:
+            raise LoadError(f.name, 0, 0, 'Cannot read snapshot: {}'.format(e))
+        snapshots.append(snapshot)
+        source = snapshot.stale_source()
+        if source is not None:
+            raise LoadError(f.name, 0, 0, '{} changed since the snapshot '
+                            'was written'.format(source))
+    return snapshots
+
+
+def snapshot_balances(snapshots, patterns=None, begin=None, end=None):
+    match_account = account_matcher(patterns)
+    accounts = {}
+    for snapshot in snapshots:
+        snapshot.balances(match_account, begin, end, accounts)
+    return accounts
+
+
+def snapshot_register_rows(snapshots, patterns=None, begin=None, end=None):
+    # Merges the rows of the snapshots by date, the rows are
+    # (key, date, description, account, quantity, commodity) as taken by
+    # report.register_lines().
+    match_account = account_matcher(patterns)
+    streams = [snapshot.register_rows(match_account, begin, end, key=i)
+               for i, snapshot in enumerate(snapshots)]
+    for row in heapq.merge(*streams, key=lambda row: row[1]):
+        yield (row[0],) + row[2:]
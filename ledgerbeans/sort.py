@@ -0,0 +1,98 @@
+import heapq
+import sys
+
+from ledgerbeans.entry import read_entries
+from ledgerbeans.rollup import SpilledRun
+
+
+comment_chars = ';#*|'
+
+# Runs merged at a time, more runs are first merged into longer ones so
+# the number of open temporary files stays bounded.
+merge_width = 64
+
+
+def is_trivia(entry):
+    # Entries of nothing but comments and empty lines move with the
+    # transaction after them, any other entry without a date is a
+    # directive.
+    return all(not line.strip() or line[0] in comment_chars
+               for line in entry.lines)
+
+
+def merge_runs(runs):
+    while len(runs) > merge_width:
+        merged = []
+        for i in range(0, len(runs), merge_width):
+            group = runs[i:i + merge_width]
+            if len(group) == 1:
+                merged.extend(group)
+            else:
+                merged.append(SpilledRun(heapq.merge(*group)))
+        runs = merged
+    return heapq.merge(*runs)
+
+
+class RunWriter:
+    # Collects (ordinal, seq, text) rows up to limit bytes of text, then
+    # writes them to a sorted run in a temporary file.
+    def __init__(self, limit):
+        self.limit = limit
+        self.rows = []
+        self.size = 0
+        self.runs = []
+
+    def add(self, row):
+        self.rows.append(row)
+        self.size += sys.getsizeof(row[2])
+        if self.size >= self.limit:
+            self.spill()
+
+    def spill(self):
+        self.rows.sort()
+        self.runs.append(SpilledRun(self.rows))
+        self.rows = []
+        self.size = 0
+
+    def flush(self):
+        # Yields all rows in order and starts over.
+        self.rows.sort()
+        runs = self.runs + [iter(self.rows)]
+        self.rows = []
+        self.size = 0
+        self.runs = []
+        yield from merge_runs(runs)
+
+
+def sort_entries(f, limit=64 * 2**20):
+    # Yields the text of the entries of f with the transactions in date
+    # order, transactions on the same date keep their order. Directives
+    # stay in place and only the transactions between two of them are
+    # sorted, as moving a transaction across a year directive or an
+    # automated transaction would change its meaning. At most about limit
+    # bytes of text are held in memory, the rest is sorted in runs on disk.
+    writer = RunWriter(limit)
+    trivia = []
+    seq = 0
+    for entry in read_entries(f):
+        text = entry.text()
+        if not text.endswith('\n'):
+            text += '\n'
+        if entry.ordinal is not None:
+            writer.add((entry.ordinal, seq, ''.join(trivia) + text))
+            seq += 1
+            trivia = []
+        elif is_trivia(entry):
+            if entry.lineno == 1:
+                # The comments at the top of the file stay there.
+                yield text
+            else:
+                trivia.append(text)
+        else:
+            for ordinal, i, text in writer.flush():
+                yield text
+            yield ''.join(trivia) + entry.text()
+            trivia = []
+    for ordinal, i, text in writer.flush():
+        yield text
+    yield ''.join(trivia)
@@ -0,0 +1,158 @@
+import math
+
+from collections import Counter
+
+from ledgerbeans import ast
+from ledgerbeans.date import from_ordinal
+
+
+item_labels = [
+    ('AutomatedTransaction', 'Automated transactions'),
+    ('PeriodicTransaction', 'Periodic transactions'),
+    ('Comment', 'Comments'),
+    ('Year', 'Year directives'),
+]
+
+
+class HyperLogLog:
+    # Estimates the number of distinct values seen in 2**precision bytes,
+    # with a standard error of about 1.04 / sqrt(2**precision), 0.8% by
+    # default. Every value is hashed to 64 bits, the first precision bits
+    # select a register, which keeps the longest run of leading zeros seen
+    # in the other bits.
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self.shift = 64 - precision
+        self.mask = (1 << self.shift) - 1
+
+    def add(self, value):
+        h = hash(value) & 0xffffffffffffffff
+        i = h >> self.shift
+        rank = self.shift - (h & self.mask).bit_length() + 1
+        if rank > self.registers[i]:
+            self.registers[i] = rank
+
+    def __len__(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Few values leave registers empty, counting those is exact
+            # enough.
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class LineCounter:
+    # Passes the lines of a file on to the lexer, keeping the lengths of
+    # the shortest and longest lines that are not empty.
+    def __init__(self, f):
+        self.file = f
+        self.name = f.name
+        self.lineno = 0
+        self.count = 0
+        self.shortest = None
+        self.longest = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.file)
+        self.lineno += 1
+        length = len(line.rstrip('\r\n'))
+        if length:
+            self.count += 1
+            if self.shortest is None or length < self.shortest[0]:
+                self.shortest = (length, self.name, self.lineno)
+            if self.longest is None or length > self.longest[0]:
+                self.longest = (length, self.name, self.lineno)
+        return line
+
+
+class Stats:
+    # Exact counts where they are bounded by the chart of accounts or the
+    # size of a transaction, estimates for payees, which grow with the
+    # journal.
+    def __init__(self):
+        self.files = 0
+        self.lines = 0
+        self.nonempty_lines = 0
+        self.shortest = None
+        self.longest = None
+        self.items = Counter()
+        self.first = None
+        self.last = None
+        self.postings = 0
+        self.sizes = Counter()
+        self.accounts = set()
+        self.commodities = set()
+        self.payees = HyperLogLog()
+
+    def add_item(self, item):
+        self.items[type(item).__name__] += 1
+        if not isinstance(item, ast.Transaction):
+            return
+        ordinal = item.ordinal
+        if self.first is None or ordinal < self.first:
+            self.first = ordinal
+        if self.last is None or ordinal > self.last:
+            self.last = ordinal
+        self.payees.add(item.description)
+        size = 0
+        for post in item:
+            if isinstance(post, ast.Posting):
+                size += 1
+                self.accounts.add(post.account.name)
+                if post.amount is not None and post.amount.symbol is not None:
+                    self.commodities.add(post.amount.symbol[0])
+        self.postings += size
+        self.sizes[size] += 1
+
+    def add_lines(self, counter):
+        self.files += 1
+        self.lines += counter.lineno
+        self.nonempty_lines += counter.count
+        if counter.shortest is not None and \
+           (self.shortest is None or counter.shortest < self.shortest):
+            self.shortest = counter.shortest
+        if counter.longest is not None and \
+           (self.longest is None or counter.longest[0] > self.longest[0]):
+            self.longest = counter.longest
+
+    def report(self):
+        transactions = self.items['Transaction']
+        yield 'Files:                    {}'.format(self.files)
+        yield 'Lines:                    {} ({} not empty)'.format(
+            self.lines, self.nonempty_lines)
+        for label, extreme in [('Shortest line', self.shortest),
+                               ('Longest line', self.longest)]:
+            if extreme is not None:
+                yield '{:26}{} characters, {}:{}'.format(label + ':',
+                                                         *extreme)
+        if self.first is not None:
+            days = self.last - self.first + 1
+            yield 'Time period:              {} to {} ({} days)'.format(
+                from_ordinal(self.first), from_ordinal(self.last), days)
+        yield 'Transactions:             {}'.format(transactions)
+        if self.first is not None:
+            yield 'Transactions per day:     {:.2f}'.format(
+                transactions / days)
+        for name, label in item_labels:
+            if self.items[name]:
+                yield '{:26}{}'.format(label + ':', self.items[name])
+        yield 'Postings:                 {}'.format(self.postings)
+        if transactions:
+            yield 'Postings per transaction: {:.2f} (at least {}, at ' \
+                'most {})'.format(self.postings / transactions,
+                                  min(self.sizes), max(self.sizes))
+            for size in sorted(self.sizes):
+                count = self.sizes[size]
+                yield '{:>8} postings: {:>10} {:6.2f}%'.format(
+                    size, count, 100 * count / transactions)
+        yield 'Accounts:                 {}'.format(len(self.accounts))
+        yield 'Commodities:              {} {}'.format(
+            len(self.commodities), ' '.join(sorted(self.commodities)))
+        yield 'Payees (estimated):       {}'.format(len(self.payees))
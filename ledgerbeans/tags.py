@@ -0,0 +1,57 @@
+from ledgerbeans import ast
+
+
+def transaction_tags(xact):
+    # Yields (item, tags) for the transaction and each of its postings.
+    # Notes on their own line belong to the posting above them, or to the
+    # transaction when no posting precedes them.
+    xact_tags = {}
+    if xact.note is not None:
+        xact_tags.update(xact.note.tags)
+    posts = []
+    post_tags = None
+    for item in xact:
+        if isinstance(item, ast.Posting):
+            post_tags = {}
+            if item.note is not None:
+                post_tags.update(item.note.tags)
+            posts.append((item, post_tags))
+        elif isinstance(item, ast.Note):
+            if post_tags is None:
+                xact_tags.update(item.tags)
+            else:
+                post_tags.update(item.tags)
+    yield xact, xact_tags
+    for post, tags in posts:
+        # Postings inherit the tags of their transaction.
+        inherited = dict(xact_tags)
+        inherited.update(tags)
+        yield post, inherited
+
+
+class TagIndex:
+    def __init__(self, transactions=()):
+        self.by_key = {}
+        self.by_value = {}
+        for xact in transactions:
+            self.add(xact)
+
+    def add(self, xact):
+        for item, tags in transaction_tags(xact):
+            for key, value in tags.items():
+                self.by_key.setdefault(key, []).append(item)
+                if value is not None:
+                    self.by_value.setdefault((key, value), []).append(item)
+
+    def lookup(self, key, value=None):
+        if value is None:
+            return self.by_key.get(key, [])
+        return self.by_value.get((key, value), [])
+
+    def transactions(self, key, value=None):
+        return [item for item in self.lookup(key, value)
+                if isinstance(item, ast.Transaction)]
+
+    def postings(self, key, value=None):
+        return [item for item in self.lookup(key, value)
+                if isinstance(item, ast.Posting)]
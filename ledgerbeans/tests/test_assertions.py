@@ -0,0 +1,75 @@
+import io
+import unittest
+
+from ledgerbeans.loader import LoadError, check_balances, load
+from ledgerbeans.report import Query, balance_report
+
+
+journal = '''\
+2024/01/05 Deposit
+    Assets:Bank                            100 EUR
+    Equity:Opening
+
+2024/01/08 Groceries
+    Expenses:Food                           25 EUR
+    Assets:Bank
+
+2024/01/10 Adjust
+    Assets:Bank                         = 80 EUR
+    Equity:Adjust
+'''
+
+appended = '''
+2024/02/01 Groceries
+    Expenses:Food                           14 EUR
+    Assets:Bank
+'''
+
+unbalanced = '''\
+2024/01/05 Deposit
+    Assets:Bank                            100 EUR
+    Equity:Opening
+
+2024/02/01 Adjust
+    Assets:Bank                         = 80 EUR
+    Equity:Adjust                           -3 EUR
+'''
+
+
+def parse(text):
+    f = io.StringIO(text)
+    f.name = '<test>'
+    return load(f)
+
+
+def balances(journal):
+    return list(balance_report(journal.transactions(), Query()))
+
+
+class ReloadTest(unittest.TestCase):
+    def test_assignment_after_reload(self):
+        first = parse(journal)
+        checker = check_balances([first])
+        self.assertIn('              80 EUR  Assets:Bank', balances(first))
+        self.assertIn('              -5 EUR  Equity:Adjust', balances(first))
+        # The server checks a reloaded journal with the checker of the
+        # last load, which only verifies the transactions that changed.
+        second = parse(journal + appended)
+        check_balances([second], checker=checker)
+        lines = balances(second)
+        self.assertIn('              66 EUR  Assets:Bank', lines)
+        self.assertIn('              -5 EUR  Equity:Adjust', lines)
+
+
+class AssignmentTest(unittest.TestCase):
+    def test_unbalanced_assignment(self):
+        # The assignment gives Assets:Bank -20 EUR, which Equity:Adjust
+        # does not balance.
+        with self.assertRaises(LoadError) as cm:
+            check_balances([parse(unbalanced)])
+        self.assertEqual(cm.exception.lineno, 5)
+        self.assertIn('-23 EUR', str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from ledgerbeans.main import commands
+
+
+# Modules only the commands that parse, print or serve may import.
+heavy_modules = {'ply', 'reg', 'asyncio'}
+
+script = 'import sys; from ledgerbeans.main import main; main(sys.argv[1:])'
+
+
+def import_times(argv):
+    # Returns {module: cumulative microseconds} of the modules imported
+    # while running the command line argv, as reported by -X importtime.
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             script] + argv,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def heavy_imports(times):
+    return sorted(name for name in times
+                  if name.split('.')[0] in heavy_modules)
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.ledger = tempfile.mkstemp(suffix='.ledger')
+        with os.fdopen(fd, 'w') as f:
+            f.write('2024/01/01 Opening\n'
+                    '    Assets:Bank                  10 EUR\n'
+                    '    Equity:Opening\n')
+
+    def tearDown(self):
+        os.unlink(self.ledger)
+
+    def test_help_of_every_command(self):
+        # Command modules are only imported when their command runs.
+        for command in commands:
+            times = import_times([command.name, '--help'])
+            self.assertIn('ledgerbeans.main', times)
+            self.assertEqual(heavy_imports(times), [], command.name)
+
+    def test_lex(self):
+        times = import_times(['lex', '-f', self.ledger])
+        self.assertIn('ledgerbeans.lexer', times)
+        self.assertEqual(heavy_imports(times), [])
+
+    def test_client(self):
+        socket_path = self.ledger + '.sock'
+        times = import_times(['client', '--socket', socket_path, 'balance'])
+        self.assertIn('ledgerbeans.protocol', times)
+        self.assertEqual(heavy_imports(times), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
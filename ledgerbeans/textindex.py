@@ -0,0 +1,156 @@
+import logging
+import os
+import pickle
+
+from array import array
+
+from ledgerbeans import ast
+from ledgerbeans.shard import cache_dirname, checksum
+
+
+logger = logging.getLogger(__name__)
+
+
+def trigrams(text):
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+class TextIndex:
+    # Maps every trigram of the case folded texts to the ascending ids of
+    # the texts containing it. The texts containing a query are among the
+    # ids in all lists of its trigrams, so a search intersects a few short
+    # lists instead of scanning every text.
+    def __init__(self, texts=()):
+        self.grams = {}
+        self.count = 0
+        for text in texts:
+            self.add(text)
+
+    def add(self, text):
+        i = self.count
+        self.count += 1
+        grams = self.grams
+        for gram in trigrams(text.casefold()):
+            ids = grams.get(gram)
+            if ids is None:
+                ids = grams[gram] = array('I')
+            ids.append(i)
+
+    def candidates(self, query):
+        # Returns the ids of the texts that may contain query, or None when
+        # query is too short to have a trigram and every text may.
+        grams = trigrams(query.casefold())
+        if not grams:
+            return None
+        lists = []
+        for gram in grams:
+            ids = self.grams.get(gram)
+            if ids is None:
+                return set()
+            lists.append(ids)
+        lists.sort(key=len)
+        found = set(lists[0])
+        for ids in lists[1:]:
+            found.intersection_update(ids)
+            if not found:
+                break
+        return found
+
+
+def transaction_notes(xact):
+    notes = []
+    if xact.note is not None:
+        notes.append(xact.note.text)
+    for item in xact:
+        if isinstance(item, ast.Note):
+            notes.append(item.text)
+        elif isinstance(item, ast.Posting) and item.note is not None:
+            notes.append(item.note.text)
+    return '\n'.join(notes)
+
+
+fields = {
+    'payee': lambda xact: xact.description,
+    'note': transaction_notes,
+}
+
+
+class TransactionIndex:
+    # Text indexes over the descriptions and the notes of the transactions
+    # of a journal, in journal order.
+    version = 1
+
+    def __init__(self, transactions):
+        self.transactions = list(transactions)
+        self.indexes = {name: TextIndex(text(xact)
+                                        for xact in self.transactions)
+                        for name, text in fields.items()}
+
+    def __getstate__(self):
+        # The transactions are taken from the journal the index is read for.
+        state = self.__dict__.copy()
+        state['transactions'] = None
+        return state
+
+    def search(self, field, query):
+        # Yields the transactions whose field contains query, ignoring case.
+        text = fields[field]
+        needle = query.casefold()
+        ids = self.indexes[field].candidates(needle)
+        if ids is None:
+            ids = range(len(self.transactions))
+        for i in sorted(ids):
+            xact = self.transactions[i]
+            if needle in text(xact).casefold():
+                yield xact
+
+
+def index_path(filename):
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, cache_dirname, name + '.text.pickle')
+
+
+def read_index(path, digest, transactions):
+    try:
+        with open(path, 'rb') as f:
+            saved_digest, index = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    if saved_digest != digest or \
+       getattr(index, 'version', None) != TransactionIndex.version:
+        return None
+    if len(transactions) != index.indexes['payee'].count:
+        return None
+    index.transactions = transactions
+    return index
+
+
+def write_index(path, digest, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump((digest, index), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def text_index(journal, keep=False):
+    # Returns the text index of journal, building it on first use. With
+    # keep, the index is saved in the cache directory next to the ledger
+    # file and read back while the file has the same checksum.
+    if journal.text_index is not None:
+        return journal.text_index
+    transactions = list(journal.transactions())
+    path = digest = None
+    if keep and os.path.isfile(journal.name):
+        path = index_path(journal.name)
+        digest = checksum(journal.name)
+        journal.text_index = read_index(path, digest, transactions)
+        if journal.text_index is not None:
+            return journal.text_index
+    journal.text_index = TransactionIndex(transactions)
+    if path is not None:
+        try:
+            write_index(path, digest, journal.text_index)
+        except OSError as e:
+            logger.warning('Cannot save text index {}: {}'.format(path, e))
+    return journal.text_index
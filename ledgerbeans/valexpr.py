@@ -0,0 +1,544 @@
+import operator
+import re
+
+from decimal import Decimal, DecimalException
+
+from ledgerbeans import ast
+from ledgerbeans.date import parse_date
+from ledgerbeans.report import format_amount, posting_amounts
+
+
+class ExpressionError(Exception):
+    def __init__(self, message, pos=0, lineno=None):
+        super().__init__(message, pos, lineno)
+        self.message = message
+        self.pos = pos
+        self.lineno = lineno
+
+    def __str__(self):
+        return self.message
+
+
+class AmountValue:
+    # A quantity of a commodity, where commodity is a (symbol, flags) tuple
+    # like in ast.Amount. Numbers combine with any commodity.
+    __slots__ = ('quantity', 'commodity')
+
+    def __init__(self, quantity, commodity):
+        self.quantity = quantity
+        self.commodity = commodity
+
+    @property
+    def symbol(self):
+        return self.commodity[0]
+
+    def other(self, other):
+        if isinstance(other, AmountValue):
+            if other.symbol != self.symbol:
+                raise TypeError('Cannot combine {} and {}'.format(
+                    self.symbol, other.symbol))
+            return other.quantity
+        if isinstance(other, (Decimal, int)):
+            return other
+        raise TypeError('Cannot combine an amount and {!r}'.format(other))
+
+    def __add__(self, other):
+        return AmountValue(self.quantity + self.other(other), self.commodity)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return AmountValue(self.quantity - self.other(other), self.commodity)
+
+    def __rsub__(self, other):
+        return AmountValue(self.other(other) - self.quantity, self.commodity)
+
+    def __mul__(self, other):
+        if isinstance(other, AmountValue):
+            raise TypeError('Cannot multiply two amounts')
+        return AmountValue(self.quantity * self.other(other), self.commodity)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, AmountValue):
+            return self.quantity / self.other(other)
+        return AmountValue(self.quantity / self.other(other), self.commodity)
+
+    def __neg__(self):
+        return AmountValue(-self.quantity, self.commodity)
+
+    def __abs__(self):
+        return AmountValue(abs(self.quantity), self.commodity)
+
+    def __bool__(self):
+        return bool(self.quantity)
+
+    def __eq__(self, other):
+        return self.quantity == self.other(other)
+
+    def __ne__(self, other):
+        return self.quantity != self.other(other)
+
+    def __lt__(self, other):
+        return self.quantity < self.other(other)
+
+    def __le__(self, other):
+        return self.quantity <= self.other(other)
+
+    def __gt__(self, other):
+        return self.quantity > self.other(other)
+
+    def __ge__(self, other):
+        return self.quantity >= self.other(other)
+
+    __hash__ = None
+
+    def __str__(self):
+        return format_amount(self.quantity, self.commodity)
+
+
+def make_amount(quantity, commodity):
+    if commodity is None:
+        return quantity
+    return AmountValue(quantity, commodity)
+
+
+token_re = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<string>'[^']*')
+  | (?P<quoted>"[^"]*")
+  | (?P<date>\[[^\]]*\])
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<op>==|!=|<=|>=|=~|!~|&&|\|\||[-+*/<>!?:(),&|])
+  | (?P<symbol>[^\s\w'"\[\]()+*/<>!?:,&|=~.-]+)
+''', re.VERBOSE)
+
+operand_end = {'number', 'string', 'quoted', 'date', 'name', 'symbol',
+               'regex'}
+
+keywords = {'and': '&', 'or': '|', 'not': '!'}
+
+
+def tokenize(text):
+    # Yields (kind, value, pos). A slash starts a regular expression where
+    # an operand is expected and divides everywhere else.
+    tokens = []
+    pos = 0
+    length = len(text)
+    while pos < length:
+        last = tokens[-1] if tokens else None
+        if text[pos] == '/' and (last is None or
+                                 (last[0] not in operand_end and
+                                  last[1] != ')')):
+            end = pos + 1
+            while end < length and text[end] != '/':
+                if text[end] == '\\':
+                    end += 1
+                end += 1
+            if end >= length:
+                raise ExpressionError("Missing closing '/'", pos)
+            tokens.append(('regex', text[pos+1:end].replace('\\/', '/'),
+                           pos))
+            pos = end + 1
+            continue
+        match = token_re.match(text, pos)
+        if match is None:
+            raise ExpressionError("Unexpected character '{}'".format(
+                text[pos]), pos)
+        kind = match.lastgroup
+        value = match.group()
+        if kind == 'name' and value in keywords:
+            kind, value = 'op', keywords[value]
+        elif kind == 'op' and value in ('&&', '||'):
+            value = value[0]
+        if kind != 'space':
+            tokens.append((kind, value, pos))
+        pos = match.end()
+    tokens.append(('end', None, length))
+    return tokens
+
+
+# Binding power of the infix operators.
+infix = {
+    '?': 10,
+    '|': 20,
+    '&': 30,
+    '==': 40, '!=': 40, '<': 40, '<=': 40, '>': 40, '>=': 40,
+    '=~': 40, '!~': 40,
+    '+': 50, '-': 50,
+    '*': 60, '/': 60,
+}
+
+prefix_power = 70
+
+
+class Parser:
+    # Parses an expression into nested tuples, using precedence climbing.
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, value):
+        kind, found, pos = self.next()
+        if found != value or kind != 'op':
+            raise ExpressionError("Expected '{}'".format(value), pos)
+
+    def parse(self):
+        node = self.expression(0)
+        kind, value, pos = self.peek()
+        if kind != 'end':
+            raise ExpressionError("Unexpected '{}'".format(value), pos)
+        return node
+
+    def expression(self, power):
+        node = self.prefix()
+        while True:
+            kind, op, pos = self.peek()
+            if kind != 'op' or infix.get(op, 0) <= power:
+                return node
+            self.next()
+            if op == '?':
+                then = self.expression(0)
+                self.expect(':')
+                otherwise = self.expression(infix['?'] - 1)
+                node = ('cond', node, then, otherwise)
+            elif op in ('&', '|'):
+                node = (op, node, self.expression(infix[op]))
+            elif op in ('=~', '!~'):
+                node = ('match', op, node, self.expression(infix[op]))
+            else:
+                node = ('binary', op, node, self.expression(infix[op]))
+
+    def prefix(self):
+        kind, value, pos = self.next()
+        if kind == 'op' and value in ('-', '!'):
+            return ('unary', value, self.expression(prefix_power))
+        if kind == 'op' and value == '(':
+            node = self.expression(0)
+            self.expect(')')
+            return node
+        if kind == 'number':
+            return ('const', self.suffix_commodity(Decimal(value), pos +
+                                                   len(value)))
+        if kind in ('symbol', 'quoted') or \
+           (kind == 'name' and value not in variables and
+            value not in functions and self.peek()[0] == 'number'):
+            return ('const', self.prefix_commodity(value, pos))
+        if kind == 'string':
+            return ('const', value[1:-1])
+        if kind == 'regex':
+            return ('regex', value)
+        if kind == 'date':
+            try:
+                return ('const', parse_date(value[1:-1]))
+            except ValueError as e:
+                raise ExpressionError(str(e), pos)
+        if kind == 'name':
+            if self.peek()[1] == '(':
+                return self.call(value, pos)
+            if value not in variables:
+                raise ExpressionError("Unknown name '{}'".format(value), pos)
+            return ('var', value)
+        if kind == 'end':
+            raise ExpressionError('Unexpected end of expression', pos)
+        raise ExpressionError("Unexpected '{}'".format(value), pos)
+
+    def suffix_commodity(self, quantity, end):
+        kind, value, pos = self.peek()
+        if kind == 'quoted' or (kind == 'name' and value not in variables and
+                                value not in functions):
+            self.next()
+            return AmountValue(quantity, (value, 'S' if pos > end else ''))
+        return quantity
+
+    def prefix_commodity(self, symbol, start):
+        kind, value, pos = self.next()
+        if kind != 'number':
+            raise ExpressionError("Expected a number after '{}'".format(
+                symbol), pos)
+        flags = 'PS' if pos > start + len(symbol) else 'P'
+        return AmountValue(Decimal(value), (symbol, flags))
+
+    def call(self, name, pos):
+        if name not in functions:
+            raise ExpressionError("Unknown function '{}'".format(name), pos)
+        self.expect('(')
+        args = []
+        if self.peek()[1] != ')':
+            args.append(self.expression(0))
+            while self.peek()[1] == ',':
+                self.next()
+                args.append(self.expression(0))
+        self.expect(')')
+        return ('call', name, args)
+
+
+class Context:
+    # What the variables of an expression refer to: a transaction and,
+    # optionally, one of its postings with its amount.
+    __slots__ = ('xact', 'post', 'quantity', 'commodity')
+
+    def __init__(self, xact, post=None, quantity=None, commodity=None):
+        self.xact = xact
+        self.post = post
+        self.quantity = quantity
+        self.commodity = commodity
+
+
+def var_amount(ctx):
+    if ctx.quantity is None:
+        raise ExpressionError('No posting amount to refer to')
+    return make_amount(ctx.quantity, ctx.commodity)
+
+
+def var_account(ctx):
+    if ctx.post is None:
+        raise ExpressionError('No posting account to refer to')
+    return ctx.post.account.name
+
+
+def var_note(ctx):
+    if ctx.post is not None and ctx.post.note is not None:
+        return ctx.post.note.text
+    if ctx.xact.note is not None:
+        return ctx.xact.note.text
+    return ''
+
+
+def var_status(flag):
+    def status(ctx):
+        item = ctx.post if ctx.post is not None else ctx.xact
+        return item.status[flag]
+    return status
+
+
+variables = {
+    'amount': var_amount,
+    'account': var_account,
+    'payee': lambda ctx: ctx.xact.description,
+    'note': var_note,
+    'date': lambda ctx: ctx.xact.ordinal,
+    'cleared': var_status('cleared'),
+    'pending': var_status('pending'),
+}
+
+# Single letter names as used by ledger.
+variables.update({
+    'a': variables['amount'],
+    'A': variables['account'],
+    'P': variables['payee'],
+    'N': variables['note'],
+    'd': variables['date'],
+    'X': variables['cleared'],
+    'Y': variables['pending'],
+})
+
+
+def fn_quantity(value):
+    if isinstance(value, AmountValue):
+        return value.quantity
+    return value
+
+
+def fn_commodity(value):
+    if isinstance(value, AmountValue):
+        return value.symbol
+    return ''
+
+
+functions = {
+    'abs': abs,
+    'quantity': fn_quantity,
+    'commodity': fn_commodity,
+}
+
+binary_operators = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+unary_operators = {
+    '-': operator.neg,
+    '!': operator.not_,
+}
+
+
+class Constant:
+    def __init__(self, value):
+        self.value = value
+
+
+def function(code):
+    if isinstance(code, Constant):
+        value = code.value
+        return lambda ctx: value
+    return code
+
+
+def compile_node(node):
+    # Compiles a parsed expression to a closure taking a Context. Nodes
+    # whose operands are all constant are evaluated here instead, so they
+    # cost nothing per evaluation.
+    kind = node[0]
+    if kind == 'const':
+        return Constant(node[1])
+    if kind == 'regex':
+        return Constant(node[1])
+    if kind == 'var':
+        return variables[node[1]]
+    if kind == 'unary':
+        op = unary_operators[node[1]]
+        operand = compile_node(node[2])
+        if isinstance(operand, Constant):
+            return Constant(apply(op, operand.value))
+        return lambda ctx: op(operand(ctx))
+    if kind == 'binary':
+        op = binary_operators[node[1]]
+        left = compile_node(node[2])
+        right = compile_node(node[3])
+        if isinstance(left, Constant) and isinstance(right, Constant):
+            return Constant(apply(op, left.value, right.value))
+        left = function(left)
+        right = function(right)
+        return lambda ctx: op(left(ctx), right(ctx))
+    if kind == 'match':
+        negate = node[1] == '!~'
+        subject = compile_node(node[2])
+        pattern = compile_node(node[3])
+        if not isinstance(pattern, Constant):
+            raise ExpressionError('Can only match a regular expression or '
+                                  'a string')
+        try:
+            search = re.compile(pattern.value, re.IGNORECASE).search
+        except re.error as e:
+            raise ExpressionError('Invalid regular expression: {}'.format(e))
+        if isinstance(subject, Constant):
+            return Constant((search(str(subject.value)) is None) == negate)
+        return lambda ctx: (search(str(subject(ctx))) is None) == negate
+    if kind == '&':
+        left = compile_node(node[1])
+        right = compile_node(node[2])
+        if isinstance(left, Constant):
+            return right if left.value else left
+        right = function(right)
+        return lambda ctx: left(ctx) and right(ctx)
+    if kind == '|':
+        left = compile_node(node[1])
+        right = compile_node(node[2])
+        if isinstance(left, Constant):
+            return left if left.value else right
+        right = function(right)
+        return lambda ctx: left(ctx) or right(ctx)
+    if kind == 'cond':
+        test = compile_node(node[1])
+        then = compile_node(node[2])
+        otherwise = compile_node(node[3])
+        if isinstance(test, Constant):
+            return then if test.value else otherwise
+        then = function(then)
+        otherwise = function(otherwise)
+        return lambda ctx: then(ctx) if test(ctx) else otherwise(ctx)
+    if kind == 'call':
+        fn = functions[node[1]]
+        args = [compile_node(arg) for arg in node[2]]
+        if all(isinstance(arg, Constant) for arg in args):
+            return Constant(apply(fn, *[arg.value for arg in args]))
+        args = [function(arg) for arg in args]
+        return lambda ctx: fn(*[arg(ctx) for arg in args])
+    raise ExpressionError('Cannot compile {}'.format(kind))
+
+
+def apply(fn, *args):
+    try:
+        return fn(*args)
+    except (TypeError, ArithmeticError, DecimalException) as e:
+        raise ExpressionError(str(e) or type(e).__name__)
+
+
+class Expression:
+    def __init__(self, text):
+        self.text = text
+        code = compile_node(Parser(text).parse())
+        self.constant = isinstance(code, Constant)
+        self.code = function(code)
+
+    def __call__(self, ctx=None):
+        try:
+            return self.code(ctx)
+        except (TypeError, ArithmeticError, DecimalException) as e:
+            raise ExpressionError(str(e) or type(e).__name__)
+
+
+_expressions = {}
+
+
+def compile_expression(text):
+    # Every distinct expression is parsed and compiled once.
+    try:
+        return _expressions[text]
+    except KeyError:
+        pass
+    expression = _expressions[text] = Expression(text)
+    return expression
+
+
+def evaluate_amount(text):
+    # Returns the (quantity, commodity) of a constant amount expression.
+    expression = compile_expression(text)
+    if not expression.constant:
+        raise ExpressionError('Amount expression must be constant')
+    value = expression()
+    if isinstance(value, AmountValue):
+        return value.quantity, value.commodity
+    if isinstance(value, (Decimal, int)) and not isinstance(value, bool):
+        return Decimal(value), None
+    raise ExpressionError('Amount expression must give an amount')
+
+
+def failed_expressions(xact):
+    # Yields the assert and check expressions of a transaction that do not
+    # hold, expr expressions are evaluated for their errors only. An
+    # expression refers to the posting above it, or to the
+    # transaction when no posting precedes it.
+    amounts = {}
+    post = None
+    for item in xact:
+        if isinstance(item, ast.Expression):
+            if item.posting is not None:
+                target = item.posting
+            else:
+                target = post
+            if target is None:
+                ctx = Context(xact)
+            else:
+                if not amounts:
+                    amounts = {p: (q, c) for p, q, c in posting_amounts(xact)}
+                quantity, commodity = amounts.get(target, (None, None))
+                ctx = Context(xact, target, quantity, commodity)
+            try:
+                value = compile_expression(item.text)(ctx)
+            except ExpressionError as e:
+                e.lineno = item.lineno
+                raise
+            if item.kind != 'expr' and not value:
+                yield item
+        elif isinstance(item, ast.Posting) and not item.generated:
+            post = item
@@ -0,0 +1,163 @@
+from ledgerbeans import ast
+from ledgerbeans.report import format_amount
+
+
+account_brackets = [
+    ('virtual', '(', ')'),
+    ('deferred', '<', '>'),
+]
+
+
+def format_account(account):
+    if account.flags['balanced']:
+        return '[{}]'.format(account.name)
+    for flag, open_char, close_char in account_brackets:
+        if account.flags[flag]:
+            return '{}{}{}'.format(open_char, account.name, close_char)
+    return account.name
+
+
+def format_status(item):
+    if item.status['cleared']:
+        return '*'
+    elif item.status['pending']:
+        return '!'
+    return None
+
+
+def format_note(note):
+    return '; {}'.format(note.text)
+
+
+def transaction_lines(xact, amount_column=48):
+    header = [xact.date.strftime('%Y/%m/%d')]
+    if xact.auxdate is not None:
+        header[0] += xact.auxdate.strftime('=%Y/%m/%d')
+    status = format_status(xact)
+    if status is not None:
+        header.append(status)
+    if xact.code is not None:
+        header.append('({})'.format(xact.code))
+    header.append(xact.description)
+    line = ' '.join(header)
+    if xact.note is not None:
+        line += '  ' + format_note(xact.note)
+    yield line
+    yield from posting_lines(xact, amount_column)
+
+
+def format_pattern(pattern):
+    # Patterns are written as bare words where that reads back the same.
+    if pattern.startswith('/') or \
+       any(char.isspace() or char == ';' for char in pattern):
+        return '/{}/'.format(pattern.replace('/', '\\/'))
+    return pattern
+
+
+def automated_transaction_lines(xact, amount_column=48):
+    yield '= ' + ' '.join(format_pattern(p) for p in xact.patterns)
+    yield from posting_lines(xact, amount_column)
+
+
+def periodic_transaction_lines(xact, amount_column=48):
+    yield '~ ' + xact.text
+    yield from posting_lines(xact, amount_column)
+
+
+def posting_lines(xact, amount_column=48):
+    for item in xact:
+        if isinstance(item, ast.Posting):
+            if not item.generated:
+                yield posting_line(item, amount_column)
+        elif isinstance(item, ast.Note):
+            yield '    ' + format_note(item)
+        elif isinstance(item, ast.Expression):
+            if not item.generated:
+                yield '    {0.kind} {0.text}'.format(item)
+
+
+def annotation_texts(post):
+    lot = post.lot
+    if lot is not None:
+        if lot.cost is not None:
+            cost = format_amount(lot.cost.amount, lot.cost.symbol)
+            if lot.total:
+                yield ' {{{{{}}}}}'.format(cost)
+            else:
+                yield ' {{{}}}'.format(cost)
+        if lot.ordinal is not None:
+            yield lot.date.strftime(' [%Y/%m/%d]')
+    if post.price is not None:
+        yield ' {} {}'.format('@@' if post.price.total else '@',
+                              format_amount(post.price.amount.amount,
+                                            post.price.amount.symbol))
+
+
+def posting_line(post, amount_column=48):
+    line = '    '
+    status = format_status(post)
+    if status is not None:
+        line += status + ' '
+    line += format_account(post.account)
+    amount = None
+    # Lots and prices follow the aligned amount.
+    annotations = ''
+    if post.amount is not None and not post.assigned and \
+       not post.inferred:
+        if post.amount.expression is not None:
+            amount = post.amount.expression
+        else:
+            amount = format_amount(post.amount.amount, post.amount.symbol)
+        annotations = ''.join(annotation_texts(post))
+    if post.balance is not None:
+        balance = '= ' + format_amount(post.balance.amount,
+                                       post.balance.symbol)
+        if amount is None:
+            amount = balance
+        elif annotations:
+            annotations += ' ' + balance
+        else:
+            amount += ' ' + balance
+    if amount is not None:
+        # Right align the amount on amount_column, keeping at least the
+        # two spaces that separate it from the account.
+        width = max(amount_column - len(line), len(amount) + 2)
+        line += amount.rjust(width) + annotations
+    if post.note is not None:
+        line += '  ' + format_note(post.note)
+    return line
+
+
+def item_lines(item, amount_column=48):
+    # The ledger syntax of an item of a journal, one line at a time.
+    if isinstance(item, ast.Transaction):
+        yield from transaction_lines(item, amount_column)
+    elif isinstance(item, ast.AutomatedTransaction):
+        yield from automated_transaction_lines(item, amount_column)
+    elif isinstance(item, ast.PeriodicTransaction):
+        yield from periodic_transaction_lines(item, amount_column)
+    elif isinstance(item, ast.Comment):
+        yield '{} {}'.format(item.char, item.text)
+    elif isinstance(item, ast.Year):
+        yield 'year {}'.format(item.year)
+    elif isinstance(item, ast.EmptyLine):
+        yield ''
+
+
+def write_items(items, output, amount_column=48, chunk_size=2**16):
+    # Joins the lines into chunks of about chunk_size characters, so
+    # output gets one write call per chunk instead of one per line.
+    chunk = []
+    size = 0
+    for item in items:
+        for line in item_lines(item, amount_column):
+            chunk.append(line)
+            size += len(line) + 1
+        if size >= chunk_size:
+            chunk.append('')
+            output.write('\n'.join(chunk))
+            chunk = []
+            size = 0
+    if chunk:
+        chunk.append('')
+        output.write('\n'.join(chunk))